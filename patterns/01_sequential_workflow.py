@@ -1,11 +1,11 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langgraph.graph import StateGraph, START, END
 from typing import TypedDict
 from dotenv import load_dotenv
-from utils import SequentialCodebase
+from utils import SequentialCodebase, enable_llm_cache, get_llm
 
 load_dotenv()
+enable_llm_cache()
 
 
 class CodeReviewState(TypedDict):
@@ -15,7 +15,9 @@ class CodeReviewState(TypedDict):
     refactored_code: str
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
+llm = get_llm()
+# Reviews of near-identical code can reuse an earlier review
+review_llm = get_llm(semantic_cache=True)
 
 coder_prompt = ChatPromptTemplate.from_messages([
     ("system", "You are a Senior Software Engineer. Write clean, well-structured Python code based on requirements."),
@@ -40,7 +42,7 @@ def coder_agent(state: CodeReviewState) -> CodeReviewState:
 
 
 def reviewer_agent(state: CodeReviewState) -> CodeReviewState:
-    response = llm.invoke(reviewer_prompt.format_messages(code=state["code"]))
+    response = review_llm.invoke(reviewer_prompt.format_messages(code=state["code"]))
     return {"review": response.content}
 
 
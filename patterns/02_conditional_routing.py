@@ -1,11 +1,11 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage, HumanMessage
 from langgraph.graph import StateGraph, START, END
 from typing import TypedDict, Literal
 from dotenv import load_dotenv
-from utils import ConditionalCodebase
+from utils import ConditionalCodebase, enable_llm_cache, get_llm
 
 load_dotenv()
+enable_llm_cache()
 
 
 class CodeAnalysisState(TypedDict):
@@ -16,47 +16,32 @@ class CodeAnalysisState(TypedDict):
     final_report: str
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
+llm = get_llm()
+# The router only answers with a single word
+router_llm = get_llm(max_tokens=16)
 
-coder_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Senior Software Engineer. Write clean Python code."),
-    ("human", "{input}")
-])
+# System prompts never change, so build them once; only the human turn is per call
+coder_system = SystemMessage(content="You are a Senior Software Engineer. Write clean Python code.")
 
-router_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Router. Analyse code and identify if it needs security, performance, or general review. Respond with just: 'security', 'performance', or 'general'."),
-    ("human", "Route this code for expert review:\n{code}")
-])
+router_system = SystemMessage(content="You are a Router. Analyse code and identify if it needs security, performance, or general review. Respond with just: 'security', 'performance', or 'general'.")
 
-security_expert_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Security Expert. Focus on vulnerabilities, authentication, authorization, input validation, and secure coding practices."),
-    ("human", "Provide security analysis for:\n{code}")
-])
+security_expert_system = SystemMessage(content="You are a Security Expert. Focus on vulnerabilities, authentication, authorization, input validation, and secure coding practices.")
 
-performance_expert_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Performance Expert. Focus on algorithmic complexity, optimization, resource usage, and scalability."),
-    ("human", "Provide performance analysis for:\n{code}")
-])
+performance_expert_system = SystemMessage(content="You are a Performance Expert. Focus on algorithmic complexity, optimization, resource usage, and scalability.")
 
-general_expert_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a General Code Expert. Focus on code quality, maintainability, readability, and best practices."),
-    ("human", "Provide general code analysis for:\n{code}")
-])
+general_expert_system = SystemMessage(content="You are a General Code Expert. Focus on code quality, maintainability, readability, and best practices.")
 
-synthesis_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Technical Lead. Synthesize the specialist analysis into actionable recommendations."),
-    ("human",
-     "Specialist Analysis:\n{specialist_analysis}\n\nProvide final recommendations:")
-])
+synthesis_system = SystemMessage(content="You are a Technical Lead. Synthesize the specialist analysis into actionable recommendations.")
 
 
 def coder_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(coder_prompt.format_messages(input=state["input"]))
+    response = llm.invoke([coder_system, HumanMessage(content=state["input"])])
     return {"code": response.content}
 
 
 def router_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(router_prompt.format_messages(code=state["code"]))
+    response = router_llm.invoke([router_system, HumanMessage(
+        content=f"Route this code for expert review:\n{state['code']}")])
     route = response.content.strip().lower()
 
     if route not in ["security", "performance", "general"]:
@@ -67,30 +52,29 @@ def router_agent(state: CodeAnalysisState) -> CodeAnalysisState:
 
 
 def security_expert_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(
-        security_expert_prompt.format_messages(code=state["code"]))
+    response = llm.invoke([security_expert_system, HumanMessage(
+        content=f"Provide security analysis for:\n{state['code']}")])
     print("🔒 Security expert analyzing code")
     return {"specialist_analysis": response.content, "route_decision": "security"}
 
 
 def performance_expert_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(
-        performance_expert_prompt.format_messages(code=state["code"]))
+    response = llm.invoke([performance_expert_system, HumanMessage(
+        content=f"Provide performance analysis for:\n{state['code']}")])
     print("⚡ Performance expert analyzing code")
     return {"specialist_analysis": response.content, "route_decision": "performance"}
 
 
 def general_expert_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(
-        general_expert_prompt.format_messages(code=state["code"]))
+    response = llm.invoke([general_expert_system, HumanMessage(
+        content=f"Provide general code analysis for:\n{state['code']}")])
     print("📋 General expert analyzing code")
     return {"specialist_analysis": response.content, "route_decision": "general"}
 
 
 def synthesis_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(synthesis_prompt.format_messages(
-        specialist_analysis=state["specialist_analysis"]
-    ))
+    response = llm.invoke([synthesis_system, HumanMessage(
+        content=f"Specialist Analysis:\n{state['specialist_analysis']}\n\nProvide final recommendations:")])
 
     route = state.get("route_decision", "unknown")
     print(f"🎯 Synthesis complete - routed via {route} expert")
@@ -1,11 +1,11 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage, HumanMessage
 from langgraph.graph import StateGraph, START, END
 from typing import TypedDict
 from dotenv import load_dotenv
-from utils import ParallelCodebase
+from utils import ParallelCodebase, enable_llm_cache, get_llm
 
 load_dotenv()
+enable_llm_cache()
 
 
 class CodeAnalysisState(TypedDict):
@@ -17,62 +17,46 @@ class CodeAnalysisState(TypedDict):
     final_report: str
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
+llm = get_llm()
 
-coder_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Senior Software Engineer. Write ONLY Python code - no bash commands, no installation instructions, just the Python implementation."),
-    ("human", "{input}")
-])
+# System prompts never change, so build them once; only the human turn is per call
+coder_system = SystemMessage(content="You are a Senior Software Engineer. Write ONLY Python code - no bash commands, no installation instructions, just the Python implementation.")
 
-security_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Security Expert. Analyse code for security vulnerabilities, input validation, and potential attack vectors."),
-    ("human", "Analyse this code for security issues:\n{code}")
-])
+security_system = SystemMessage(content="You are a Security Expert. Analyse code for security vulnerabilities, input validation, and potential attack vectors.")
 
-performance_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Performance Expert. Analyse code for efficiency, algorithmic complexity, and optimisation opportunities."),
-    ("human", "Analyse this code for performance issues:\n{code}")
-])
+performance_system = SystemMessage(content="You are a Performance Expert. Analyse code for efficiency, algorithmic complexity, and optimisation opportunities.")
 
-style_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Code Style Expert. Analyse code for PEP 8 compliance, naming conventions, and code organisation."),
-    ("human", "Analyse this code for style and readability issues:\n{code}")
-])
+style_system = SystemMessage(content="You are a Code Style Expert. Analyse code for PEP 8 compliance, naming conventions, and code organisation.")
 
-synthesis_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Technical Lead. Synthesise analysis reports into actionable recommendations with priorities."),
-    ("human",
-     "Security Analysis:\n{security}\n\nPerformance Analysis:\n{performance}\n\nStyle Analysis:\n{style}\n\nProvide prioritised recommendations:")
-])
+synthesis_system = SystemMessage(content="You are a Technical Lead. Synthesise analysis reports into actionable recommendations with priorities.")
 
 
 def coder_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(coder_prompt.format_messages(input=state["input"]))
+    response = llm.invoke([coder_system, HumanMessage(content=state["input"])])
     return {"code": response.content}
 
 
 def security_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(security_prompt.format_messages(code=state["code"]))
+    response = llm.invoke([security_system, HumanMessage(
+        content=f"Analyse this code for security issues:\n{state['code']}")])
     return {"security_analysis": response.content}
 
 
 def performance_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(
-        performance_prompt.format_messages(code=state["code"]))
+    response = llm.invoke([performance_system, HumanMessage(
+        content=f"Analyse this code for performance issues:\n{state['code']}")])
     return {"performance_analysis": response.content}
 
 
 def style_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(style_prompt.format_messages(code=state["code"]))
+    response = llm.invoke([style_system, HumanMessage(
+        content=f"Analyse this code for style and readability issues:\n{state['code']}")])
     return {"style_analysis": response.content}
 
 
 def synthesis_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(synthesis_prompt.format_messages(
-        security=state["security_analysis"],
-        performance=state["performance_analysis"],
-        style=state["style_analysis"]
-    ))
+    response = llm.invoke([synthesis_system, HumanMessage(
+        content=f"Security Analysis:\n{state['security_analysis']}\n\nPerformance Analysis:\n{state['performance_analysis']}\n\nStyle Analysis:\n{state['style_analysis']}\n\nProvide prioritised recommendations:")])
     return {"final_report": response.content}
 
 
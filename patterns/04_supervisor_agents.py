@@ -1,11 +1,13 @@
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langgraph.graph import StateGraph, START, END
-from typing import TypedDict, Literal
+from typing import TypedDict, Literal, Annotated
+import operator
 from dotenv import load_dotenv
-from utils import SupervisorCodebase
+from utils import SupervisorCodebase, enable_llm_cache, get_llm
 
 load_dotenv()
+enable_llm_cache()
 
 
 class SupervisorState(TypedDict):
@@ -13,17 +15,15 @@ class SupervisorState(TypedDict):
     code: str
     security_report: str
     quality_report: str
-    completed_agents: list
+    completed_agents: Annotated[list, operator.add]
     final_analysis: str
     next_agent: str
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
+llm = get_llm()
 
-coder_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Senior Software Engineer. Write ONLY production-ready Python code with proper error handling - no bash commands, no installation instructions, just the Python implementation."),
-    ("human", "{input}")
-])
+# System prompts never change, so build them once; only the human turn is per call
+coder_system = SystemMessage(content="You are a Senior Software Engineer. Write ONLY production-ready Python code with proper error handling - no bash commands, no installation instructions, just the Python implementation.")
 
 supervisor_prompt = ChatPromptTemplate.from_messages([
     ("system",
@@ -31,24 +31,15 @@ supervisor_prompt = ChatPromptTemplate.from_messages([
     ("human", "Code needs analysis:\n{code}")
 ])
 
-security_expert_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Security Expert. Focus on vulnerabilities and security best practices."),
-    ("human", "Security analysis for:\n{code}")
-])
+security_expert_system = SystemMessage(content="You are a Security Expert. Focus on vulnerabilities and security best practices.")
 
-quality_expert_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Quality Expert. Review code structure and maintainability."),
-    ("human", "Quality analysis for:\n{code}")
-])
+quality_expert_system = SystemMessage(content="You are a Quality Expert. Review code structure and maintainability.")
 
-synthesis_prompt = ChatPromptTemplate.from_messages([
-    ("system", "Create final analysis summary with key recommendations."),
-    ("human", "Security: {security_report}\n\nQuality: {quality_report}")
-])
+synthesis_system = SystemMessage(content="Create final analysis summary with key recommendations.")
 
 
 def coder_agent(state: SupervisorState) -> SupervisorState:
-    response = llm.invoke(coder_prompt.format_messages(input=state["input"]))
+    response = llm.invoke([coder_system, HumanMessage(content=state["input"])])
     return {
         "code": response.content,
         "completed_agents": [],
@@ -69,26 +60,22 @@ def supervisor_agent(state: SupervisorState) -> SupervisorState:
 
 
 def security_expert_agent(state: SupervisorState) -> SupervisorState:
-    response = llm.invoke(
-        security_expert_prompt.format_messages(code=state["code"]))
-    completed = state.get("completed_agents", []).copy()
-    completed.append("security_expert")
-    return {"security_report": response.content, "completed_agents": completed}
+    response = llm.invoke([security_expert_system, HumanMessage(
+        content=f"Security analysis for:\n{state['code']}")])
+    return {"security_report": response.content, "completed_agents": ["security_expert"]}
 
 
 def quality_expert_agent(state: SupervisorState) -> SupervisorState:
-    response = llm.invoke(
-        quality_expert_prompt.format_messages(code=state["code"]))
-    completed = state.get("completed_agents", []).copy()
-    completed.append("quality_expert")
-    return {"quality_report": response.content, "completed_agents": completed}
+    response = llm.invoke([quality_expert_system, HumanMessage(
+        content=f"Quality analysis for:\n{state['code']}")])
+    return {"quality_report": response.content, "completed_agents": ["quality_expert"]}
 
 
 def synthesis_agent(state: SupervisorState) -> SupervisorState:
-    response = llm.invoke(synthesis_prompt.format_messages(
-        security_report=state.get("security_report", "Not analysed"),
-        quality_report=state.get("quality_report", "Not analysed")
-    ))
+    security_report = state.get("security_report", "Not analysed")
+    quality_report = state.get("quality_report", "Not analysed")
+    response = llm.invoke([synthesis_system, HumanMessage(
+        content=f"Security: {security_report}\n\nQuality: {quality_report}")])
     return {"final_analysis": response.content}
 
 
@@ -1,55 +1,52 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage, HumanMessage
 from langgraph.graph import StateGraph, START, END
-from typing import TypedDict, Literal
+from pydantic import BaseModel, Field
+from typing import TypedDict, Literal, Annotated
+import operator
 from dotenv import load_dotenv
-from utils import EvaluatorCodebase
+from utils import EvaluatorCodebase, enable_llm_cache, get_llm
 
 load_dotenv()
+enable_llm_cache()
 
 
 class OptimisationState(TypedDict):
     input: str
-    code: list
+    # Every version is kept for the audit trail; nodes return only the new one
+    code: Annotated[list, operator.add]
     score: int
     scores: list
     iteration_count: int
     final_code: str
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
+class Score(BaseModel):
+    score: int = Field(ge=1, le=10, description="Overall code quality")
 
-generator_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Senior Software Engineer. Write ONLY Python code - no bash commands, no installation instructions, just the Python implementation."),
-    ("human", "{input}")
-])
 
-evaluator_prompt = ChatPromptTemplate.from_messages([
-    ("system", "Rate this code quality from 1-10. Consider security, performance, and readability. Respond with just the number."),
-    ("human", "Code:\n{code}")
-])
+llm = get_llm()
+# Scores only come from the exact cache: a lightly edited rewrite would embed
+# close to the version before it and get back that version's score
+score_llm = get_llm(max_tokens=32).with_structured_output(Score)
 
-optimiser_prompt = ChatPromptTemplate.from_messages([
-    ("system", "Improve this code based on quality concerns. Focus on security, performance, and readability."),
-    ("human", "Code:\n{code}")
-])
+# System prompts never change, so build them once; only the human turn is per call
+generator_system = SystemMessage(content="You are a Senior Software Engineer. Write ONLY Python code - no bash commands, no installation instructions, just the Python implementation.")
+
+evaluator_system = SystemMessage(content="Rate this code quality from 1-10. Consider security, performance, and readability.")
+
+optimiser_system = SystemMessage(content="Improve this code based on quality concerns. Focus on security, performance, and readability.")
 
 
 def code_generator(state: OptimisationState) -> OptimisationState:
-    response = llm.invoke(
-        generator_prompt.format_messages(input=state["input"]))
+    response = llm.invoke([generator_system, HumanMessage(content=state["input"])])
     return {"code": [response.content], "iteration_count": 0, "quality_scores": []}
 
 
 def quality_evaluator_agent(state: OptimisationState) -> OptimisationState:
     current_code = state["code"][-1] if state["code"] else ""
 
-    response = llm.invoke(evaluator_prompt.format_messages(code=current_code))
-
-    try:
-        score = int(response.content.strip())
-    except:
-        score = 5
+    score = score_llm.invoke([evaluator_system, HumanMessage(
+        content=f"Code:\n{current_code}")]).score
 
     print(f"📊 Quality score: {score}/10")
 
@@ -63,11 +60,11 @@ def quality_evaluator_agent(state: OptimisationState) -> OptimisationState:
 def optimiser_agent(state: OptimisationState) -> OptimisationState:
     current_code = state["code"][-1] if state["code"] else ""
 
-    response = llm.invoke(optimiser_prompt.format_messages(code=current_code))
+    response = llm.invoke([optimiser_system, HumanMessage(
+        content=f"Code:\n{current_code}")])
 
-    updated_code_list = state["code"] + [response.content]
     return {
-        "code": updated_code_list,
+        "code": [response.content],
         "iteration_count": state["iteration_count"] + 1
     }
 
@@ -1,9 +1,11 @@
-from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, START, END
 from typing import TypedDict
+import functools
 from dotenv import load_dotenv
+from utils import enable_llm_cache, get_llm
 
 load_dotenv()
+enable_llm_cache()
 
 
 class State(TypedDict):
@@ -12,30 +14,31 @@ class State(TypedDict):
     review: str
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
-
-
 def coder(state: State) -> State:
-    response = llm.invoke(f"Write Python code for: {state['input']}")
+    response = get_llm().invoke(f"Write Python code for: {state['input']}")
     return {"code": response.content}
 
 
 def reviewer(state: State) -> State:
-    response = llm.invoke(f"Review this code:\n{state['code']}")
+    response = get_llm().invoke(f"Review this code:\n{state['code']}")
     return {"review": response.content}
 
 
-builder = StateGraph(State)
-builder.add_node("coder", coder)
-builder.add_node("reviewer", reviewer)
+@functools.lru_cache(maxsize=1)
+def get_workflow():
+    # Built on first use, so importing the module doesn't compile the graph
+    builder = StateGraph(State)
+    builder.add_node("coder", coder)
+    builder.add_node("reviewer", reviewer)
+
+    builder.add_edge(START, "coder")
+    builder.add_edge("coder", "reviewer")
+    builder.add_edge("reviewer", END)
 
-builder.add_edge(START, "coder")
-builder.add_edge("coder", "reviewer")
-builder.add_edge("reviewer", END)
+    return builder.compile()
 
-workflow = builder.compile()
 
 if __name__ == "__main__":
-    result = workflow.invoke({"input": "email validator function"})
+    result = get_workflow().invoke({"input": "email validator function"})
     print("CODE:", result["code"])
     print("REVIEW:", result["review"])
@@ -1,9 +1,12 @@
-from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, START, END
 from typing import TypedDict, Literal
+import asyncio
+import functools
 from dotenv import load_dotenv
+from utils import enable_llm_cache, get_llm
 
 load_dotenv()
+enable_llm_cache()
 
 
 class State(TypedDict):
@@ -13,65 +16,85 @@ class State(TypedDict):
     analysis: str
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
-
-
-def coder(state: State) -> State:
-    response = llm.invoke(f"Write Python code for: {state['input']}")
+async def coder(state: State) -> State:
+    response = await get_llm().ainvoke(f"Write Python code for: {state['input']}")
     return {"code": response.content}
 
 
-def router(state: State) -> State:
-    response = llm.invoke(
-        f"Analyze this code. Respond with 'security', 'performance', or 'general':\n{state['code']}")
-    route = response.content.strip().lower()
-    if route not in ["security", "performance", "general"]:
-        route = "general"
-    return {"route": route}
+async def router(state: State) -> State:
+    response = await get_llm().ainvoke(
+        f"Analyze this code. Respond with 'security', 'performance', or 'general' (comma-separate several if the code mixes concerns):\n{state['code']}")
+    routes = [route.strip() for route in response.content.lower().split(",")]
+    routes = [route for route in routes
+              if route in ["security", "performance", "general"]]
+    # Each expert runs once even if the router repeats it
+    routes = list(dict.fromkeys(routes))
+    return {"route": ",".join(routes) or "general"}
 
 
-def security_expert(state: State) -> State:
-    response = llm.invoke(f"Security analysis:\n{state['code']}")
+async def security_expert(state: State) -> State:
+    response = await get_llm().ainvoke(f"Security analysis:\n{state['code']}")
     return {"analysis": response.content}
 
 
-def performance_expert(state: State) -> State:
-    response = llm.invoke(f"Performance analysis:\n{state['code']}")
+async def performance_expert(state: State) -> State:
+    response = await get_llm().ainvoke(f"Performance analysis:\n{state['code']}")
     return {"analysis": response.content}
 
 
-def general_expert(state: State) -> State:
-    response = llm.invoke(f"General analysis:\n{state['code']}")
+async def general_expert(state: State) -> State:
+    response = await get_llm().ainvoke(f"General analysis:\n{state['code']}")
     return {"analysis": response.content}
 
 
-def route_to_expert(state: State) -> Literal["security_expert", "performance_expert", "general_expert"]:
+async def multi_expert(state: State) -> State:
+    # Experts only read the code, so their calls can run concurrently
+    routes = state["route"].split(",")
+    responses = await asyncio.gather(*[
+        get_llm().ainvoke(f"{route.title()} analysis:\n{state['code']}")
+        for route in routes
+    ])
+    analyses = [f"{route.title()}: {response.content}"
+                for route, response in zip(routes, responses)]
+    return {"analysis": "\n\n".join(analyses)}
+
+
+def route_to_expert(state: State) -> Literal["security_expert", "performance_expert", "general_expert", "multi_expert"]:
     route = state.get("route", "general")
+    if "," in route:
+        return "multi_expert"
     return f"{route}_expert"
 
 
-builder = StateGraph(State)
-builder.add_node("coder", coder)
-builder.add_node("router", router)
-builder.add_node("security_expert", security_expert)
-builder.add_node("performance_expert", performance_expert)
-builder.add_node("general_expert", general_expert)
-
-builder.add_edge(START, "coder")
-builder.add_edge("coder", "router")
-builder.add_conditional_edges("router", route_to_expert, {
-    "security_expert": "security_expert",
-    "performance_expert": "performance_expert",
-    "general_expert": "general_expert"
-})
-builder.add_edge("security_expert", END)
-builder.add_edge("performance_expert", END)
-builder.add_edge("general_expert", END)
+@functools.lru_cache(maxsize=1)
+def get_workflow():
+    # Built on first use, so importing the module doesn't compile the graph
+    builder = StateGraph(State)
+    builder.add_node("coder", coder)
+    builder.add_node("router", router)
+    builder.add_node("security_expert", security_expert)
+    builder.add_node("performance_expert", performance_expert)
+    builder.add_node("general_expert", general_expert)
+    builder.add_node("multi_expert", multi_expert)
+
+    builder.add_edge(START, "coder")
+    builder.add_edge("coder", "router")
+    builder.add_conditional_edges("router", route_to_expert, {
+        "security_expert": "security_expert",
+        "performance_expert": "performance_expert",
+        "general_expert": "general_expert",
+        "multi_expert": "multi_expert"
+    })
+    builder.add_edge("security_expert", END)
+    builder.add_edge("performance_expert", END)
+    builder.add_edge("general_expert", END)
+    builder.add_edge("multi_expert", END)
+
+    return builder.compile()
 
-workflow = builder.compile()
 
 if __name__ == "__main__":
-    result = workflow.invoke({"input": "user authentication system"})
+    result = asyncio.run(get_workflow().ainvoke({"input": "user authentication system"}))
     print("CODE:", result["code"])
     print("ROUTED TO:", result["route"])
     print("ANALYSIS:", result["analysis"])
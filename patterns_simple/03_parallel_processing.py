@@ -1,9 +1,12 @@
-from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, START, END
 from typing import TypedDict
+import asyncio
+import functools
 from dotenv import load_dotenv
+from utils import enable_llm_cache, get_llm
 
 load_dotenv()
+enable_llm_cache()
 
 
 class State(TypedDict):
@@ -14,47 +17,57 @@ class State(TypedDict):
     report: str
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
+# Reviews this short that only say "no issues" leave nothing to synthesise
+CLEAN_REPORT_LIMIT = 200
+CLEAN_MARKERS = ("no issue", "none")
 
 
-def coder(state: State) -> State:
-    response = llm.invoke(f"Write Python code for: {state['input']}")
-    return {"code": response.content}
+def is_clean(analysis: str) -> bool:
+    text = analysis.lower()
+    return any(marker in text for marker in CLEAN_MARKERS)
 
 
-def security_check(state: State) -> State:
-    response = llm.invoke(f"Security issues in:\n{state['code']}")
-    return {"security": response.content}
+async def coder(state: State) -> State:
+    response = await get_llm().ainvoke(f"Write Python code for: {state['input']}")
+    return {"code": response.content}
 
 
-def performance_check(state: State) -> State:
-    response = llm.invoke(f"Performance issues in:\n{state['code']}")
-    return {"performance": response.content}
+async def dual_review(state: State) -> State:
+    prompts = [
+        f"Security issues in:\n{state['code']}",
+        f"Performance issues in:\n{state['code']}"
+    ]
+    security, performance = await get_llm().abatch(prompts)
+    return {"security": security.content, "performance": performance.content}
 
 
-def synthesis_agent(state: State) -> State:
+async def synthesis_agent(state: State) -> State:
     analyses = [state["security"], state["performance"]]
+    if sum(map(len, analyses)) < CLEAN_REPORT_LIMIT and all(map(is_clean, analyses)):
+        return {"report": "No significant issues detected."}
     combined = "\n\n".join(analyses)
-    response = llm.invoke(f"Synthesise these analyses:\n{combined}")
+    response = await get_llm().ainvoke(f"Synthesise these analyses:\n{combined}")
     return {"report": response.content}
 
 
-builder = StateGraph(State)
-builder.add_node("coder", coder)
-builder.add_node("security_check", security_check)
-builder.add_node("performance_check", performance_check)
-builder.add_node("synthesis_agent", synthesis_agent)
+@functools.lru_cache(maxsize=1)
+def get_workflow():
+    # Built on first use, so importing the module doesn't compile the graph
+    builder = StateGraph(State)
+    builder.add_node("coder", coder)
+    builder.add_node("dual_review", dual_review)
+    builder.add_node("synthesis_agent", synthesis_agent)
+
+    builder.add_edge(START, "coder")
+    builder.add_edge("coder", "dual_review")
+    builder.add_edge("dual_review", "synthesis_agent")
+    builder.add_edge("synthesis_agent", END)
 
-builder.add_edge(START, "coder")
-builder.add_edge("coder", "security_check")
-builder.add_edge("coder", "performance_check")
-builder.add_edge("security_check", "synthesis_agent")
-builder.add_edge("performance_check", "synthesis_agent")
-builder.add_edge("synthesis_agent", END)
+    return builder.compile()
 
-workflow = builder.compile()
 
 if __name__ == "__main__":
-    result = workflow.invoke({"input": "API endpoint with database"})
+    result = asyncio.run(get_workflow().ainvoke(
+        {"input": "API endpoint with database"}))
     print("CODE:", result["code"])
     print("SYNTHESIS:", result["report"])
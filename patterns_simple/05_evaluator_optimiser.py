@@ -1,42 +1,73 @@
-from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, START, END
-from typing import TypedDict, Literal
+from pydantic import BaseModel
+from typing import TypedDict, Literal, Dict, Optional
+import asyncio
+import functools
+import hashlib
 from dotenv import load_dotenv
+from utils import enable_llm_cache, get_llm
 
 load_dotenv()
+enable_llm_cache()
 
 
 class State(TypedDict):
     input: str
-    code: str
-    score: int
+    code_ref: str
+    score: Optional[int]  # None until the current code has been scored
     iterations: int
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
+class EvalAndFix(BaseModel):
+    score: int
+    improved_code: str
+
+
+# Code bodies live here keyed by content hash, so state only carries the hash
+code_store: Dict[str, str] = {}
+# Scores are keyed by the same hash; rewrites are never reused
+score_store: Dict[str, int] = {}
+
 
+@functools.lru_cache(maxsize=1)
+def get_review_llm():
+    return get_llm().with_structured_output(EvalAndFix)
 
-def generator(state: State) -> State:
-    response = llm.invoke(f"Write Python code for: {state['input']}")
-    return {"code": response.content, "iterations": state.get("iterations", 0)}
 
+def store_code(code: str) -> str:
+    code_ref = hashlib.sha256(code.encode()).hexdigest()
+    code_store[code_ref] = code
+    return code_ref
 
-def evaluator(state: State) -> State:
-    response = llm.invoke(
-        f"Rate code quality 1-10:\n{state['code']}\nJust the number:")
-    try:
-        score = int(response.content.strip())
-    except:
-        score = 5
-    return {"score": score}
 
+async def generator(state: State) -> State:
+    response = await get_llm().ainvoke(f"Write Python code for: {state['input']}")
+    return {"code_ref": store_code(response.content), "iterations": state.get("iterations", 0)}
 
-def optimiser(state: State) -> State:
-    response = llm.invoke(f"Improve this code:\n{state['code']}")
-    return {"code": response.content, "iterations": state["iterations"] + 1}
+
+async def evaluate_and_improve(state: State) -> State:
+    code_ref = state["code_ref"]
+    score = score_store.get(code_ref)
+    # A stored score settles it unless the code still needs a rewrite
+    if score is not None and (score >= 8 or state["iterations"] >= 2):
+        return {"score": score}
+
+    # One call both scores the code and proposes a rewrite
+    result = await get_review_llm().ainvoke(
+        f"Rate this code's quality 1-10 and give an improved version:\n{code_store[code_ref]}")
+    score = score_store.setdefault(code_ref, result.score)
+
+    if score >= 8 or state["iterations"] >= 2:
+        return {"score": score}
+    # The rewrite goes back round to be scored before the loop can end
+    improved_ref = store_code(result.improved_code)
+    return {"score": score_store.get(improved_ref), "code_ref": improved_ref,
+            "iterations": state["iterations"] + 1}
 
 
 def should_continue(state: State) -> Literal["optimise", "done"]:
+    if state.get("score") is None:
+        return "optimise"
     if state.get("iterations", 0) >= 2:
         return "done"
     if state.get("score", 0) >= 8:
@@ -44,21 +75,23 @@ def should_continue(state: State) -> Literal["optimise", "done"]:
     return "optimise"
 
 
-builder = StateGraph(State)
-builder.add_node("generator", generator)
-builder.add_node("evaluator", evaluator)
-builder.add_node("optimiser", optimiser)
+@functools.lru_cache(maxsize=1)
+def get_workflow():
+    # Built on first use, so importing the module doesn't compile the graph
+    builder = StateGraph(State)
+    builder.add_node("generator", generator)
+    builder.add_node("evaluate_and_improve", evaluate_and_improve)
+
+    builder.add_edge(START, "generator")
+    builder.add_edge("generator", "evaluate_and_improve")
+    builder.add_conditional_edges("evaluate_and_improve", should_continue, {
+                                  "optimise": "evaluate_and_improve", "done": END})
 
-builder.add_edge(START, "generator")
-builder.add_edge("generator", "evaluator")
-builder.add_conditional_edges("evaluator", should_continue, {
-                              "optimise": "optimiser", "done": END})
-builder.add_edge("optimiser", "evaluator")
+    return builder.compile()
 
-workflow = builder.compile()
 
 if __name__ == "__main__":
-    result = workflow.invoke({"input": "file upload API"})
+    result = asyncio.run(get_workflow().ainvoke({"input": "file upload API"}))
     print(
         f"FINAL CODE (Score: {result['score']}, Iterations: {result['iterations']}):")
-    print(result["code"])
+    print(code_store[result["code_ref"]])
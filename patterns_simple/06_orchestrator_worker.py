@@ -1,74 +1,69 @@
-from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, START, END
-from langgraph.types import Send
-from typing import TypedDict, List, Annotated
-import operator
+from typing import TypedDict, List
+import asyncio
+import functools
+import re
 from dotenv import load_dotenv
+from utils import enable_llm_cache, get_llm
 
 load_dotenv()
+enable_llm_cache()
 
 
 class State(TypedDict):
     input: str
     subtasks: List[str]
-    worker_outputs: Annotated[List[str], operator.add]
+    worker_outputs: List[str]
     final_result: str
 
 
-class WorkerState(TypedDict):
-    task: str
+# One subtask per line, minus any "-", "*" or "1." / "1)" list marker
+_BULLET_RE = re.compile(r"^[ \t*-]*(?:\d+[.)][ \t]+)?([^\s-].*?)[ \t\r-]*$", re.M)
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
-
-
-def orchestrator(state: State) -> State:
-    response = llm.invoke(
+async def orchestrator(state: State) -> State:
+    response = await get_llm().ainvoke(
         f"Break down this coding task into 3 simple subtasks: {state['input']}")
 
-    lines = response.content.strip().split('\n')
-    subtasks = [line.strip('- ').strip() for line in lines if line.strip()][:3]
+    subtasks = _BULLET_RE.findall(response.content)[:3]
 
     print(f"Orchestrator created {len(subtasks)} subtasks")
-    return {"subtasks": subtasks, "worker_outputs": []}
-
-
-def create_workers(state: State):
-    return [Send("worker", {"task": task}) for task in state["subtasks"]]
+    return {"subtasks": subtasks}
 
 
-def worker(state: WorkerState) -> WorkerState:
-    response = llm.invoke(f"Complete this coding subtask: {state['task']}")
-    print(f"Worker completed: {state['task'][:30]}...")
-    return {"worker_outputs": [response.content]}
+async def run_workers(state: State) -> State:
+    # A handful of subtasks fit in one batched call, with results in plan order
+    prompts = [f"Complete this coding subtask: {task}" for task in state["subtasks"]]
+    responses = await get_llm().abatch(prompts)
+    for task in state["subtasks"]:
+        print(f"Worker completed: {task[:30]}...")
+    return {"worker_outputs": [response.content for response in responses]}
 
 
-def collect_results(state: State) -> State:
-    return state
-
-
-def synthesiser(state: State) -> State:
+async def synthesiser(state: State) -> State:
     combined = "\n\n".join(state["worker_outputs"])
-    response = llm.invoke(
+    response = await get_llm().ainvoke(
         f"Combine these code pieces into one solution:\n{combined}")
     return {"final_result": response.content}
 
 
-builder = StateGraph(State)
-builder.add_node("orchestrator", orchestrator)
-builder.add_node("worker", worker)
-builder.add_node("collect_results", collect_results)
-builder.add_node("synthesiser", synthesiser)
+@functools.lru_cache(maxsize=1)
+def get_workflow():
+    # Built on first use, so importing the module doesn't compile the graph
+    builder = StateGraph(State)
+    builder.add_node("orchestrator", orchestrator)
+    builder.add_node("run_workers", run_workers)
+    builder.add_node("synthesiser", synthesiser)
+
+    builder.add_edge(START, "orchestrator")
+    builder.add_edge("orchestrator", "run_workers")
+    builder.add_edge("run_workers", "synthesiser")
+    builder.add_edge("synthesiser", END)
 
-builder.add_edge(START, "orchestrator")
-builder.add_conditional_edges("orchestrator", create_workers, ["worker"])
-builder.add_edge("worker", "collect_results")
-builder.add_edge("collect_results", "synthesiser")
-builder.add_edge("synthesiser", END)
+    return builder.compile()
 
-workflow = builder.compile()
 
 if __name__ == "__main__":
-    result = workflow.invoke({"input": "email validation API endpoint"})
+    result = asyncio.run(get_workflow().ainvoke({"input": "email validation API endpoint"}))
     print("FINAL RESULT:")
     print(result["final_result"])
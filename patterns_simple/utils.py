@@ -0,0 +1,76 @@
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Any, Optional, Tuple
+
+import httpx
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.globals import set_llm_cache
+from langchain_core.load import dumps, loads
+from langchain_openai import ChatOpenAI
+
+
+class SQLiteLLMCache(BaseCache):
+    """Exact-match LLM response cache keyed on a SHA-256 of model settings and prompt"""
+
+    def __init__(self, database_path: str = ".llm_cache.db"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(database_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, generations TEXT)")
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        # llm_string carries the model name and temperature, prompt the serialised messages
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT generations FROM llm_cache WHERE key = ?",
+                (self._key(prompt, llm_string),)).fetchone()
+        return loads(row[0]) if row else None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, generations) VALUES (?, ?)",
+                (self._key(prompt, llm_string), dumps(list(return_val))))
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_cache")
+
+
+def enable_llm_cache(database_path: str = ".llm_cache.db") -> None:
+    """Serve repeated prompts from a local cache; only meaningful with temperature=0"""
+    set_llm_cache(SQLiteLLMCache(database_path))
+
+
+# One connection pool for every model client, so calls reuse warm connections
+# The pool size also caps requests in flight: extra calls wait for a free
+# connection instead of running into the rate limit and backing off
+_MAX_CONCURRENT_REQUESTS = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+_HTTP_LIMITS = httpx.Limits(max_connections=_MAX_CONCURRENT_REQUESTS,
+                            max_keepalive_connections=_MAX_CONCURRENT_REQUESTS)
+
+# Fixed sampling seed, so a prompt answered fresh matches what an earlier
+# (possibly since cleared) cache run returned
+_LLM_SEED = 42
+
+
+@functools.lru_cache(maxsize=1)
+def _http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    return httpx.Client(limits=_HTTP_LIMITS), httpx.AsyncClient(limits=_HTTP_LIMITS)
+
+
+@functools.lru_cache(maxsize=None)
+def get_llm(model: str = "gpt-4.1-nano") -> ChatOpenAI:
+    """Shared ChatOpenAI for a model, built on first use over the pooled clients"""
+    http_client, http_async_client = _http_clients()
+    return ChatOpenAI(model=model, temperature=0, seed=_LLM_SEED, max_retries=2,
+                      http_client=http_client, http_async_client=http_async_client)
@@ -1,11 +1,16 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
-from typing import TypedDict
+from typing import TypedDict, List
+import asyncio
+import functools
+import sys
+import time
 from dotenv import load_dotenv
-from utils import SequentialCodebase
+from utils import SequentialCodebase, enable_llm_cache, get_llm
 
 load_dotenv()
+enable_llm_cache()
 
 
 class CodeReviewState(TypedDict):
@@ -17,87 +22,73 @@ class CodeReviewState(TypedDict):
     code_type: str
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
+llm = get_llm()
+# Reviews of near-identical code can reuse an earlier review
+review_llm = get_llm(semantic_cache=True)
 
-coder_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Senior Software Engineer with expertise in secure coding. Write clean, well-structured Python code that prioritizes security and follows security best practices. ONLY output the Python code."),
-    ("human", "{input}")
-])
+# Batch streamed tokens so the console isn't written once per token
+STREAM_FLUSH_SECONDS = 0.05
 
-reviewer_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Security-focused Code Reviewer. Provide constructive feedback focusing on security vulnerabilities, potential attack vectors, input validation, and secure coding practices."),
-    ("human", "Review this code for security issues:\n{code}")
-])
+# System prompts never change, so build them once; only the human turn is per call
+coder_system = SystemMessage(content="You are a Senior Software Engineer with expertise in secure coding. Write clean, well-structured Python code that prioritizes security and follows security best practices. ONLY output the Python code.")
 
-web_refactorer_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Web Security Refactoring Expert. Implement security improvements for web applications, focusing on XSS prevention, CSRF protection, and secure HTTP handling."),
-    ("human",
-     "Original web code:\n{code}\n\nSecurity review:\n{review}\n\nRefactor for web security:")
-])
+reviewer_system = SystemMessage(content="You are a Security-focused Code Reviewer. Provide constructive feedback focusing on security vulnerabilities, potential attack vectors, input validation, and secure coding practices.")
 
-api_refactorer_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are an API Security Refactoring Expert. Implement security improvements for APIs, focusing on authentication, authorization, input validation, and rate limiting."),
-    ("human",
-     "Original API code:\n{code}\n\nSecurity review:\n{review}\n\nRefactor for API security:")
-])
+web_refactorer_system = SystemMessage(content="You are a Web Security Refactoring Expert. Implement security improvements for web applications, focusing on XSS prevention, CSRF protection, and secure HTTP handling.")
 
-data_refactorer_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Data Security Refactoring Expert. Implement security improvements for data processing, focusing on data sanitization, encryption, and secure data handling."),
-    ("human",
-     "Original data processing code:\n{code}\n\nSecurity review:\n{review}\n\nRefactor for data security:")
-])
+api_refactorer_system = SystemMessage(content="You are an API Security Refactoring Expert. Implement security improvements for APIs, focusing on authentication, authorization, input validation, and rate limiting.")
 
-tester_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Security Testing Expert. Generate comprehensive unit tests that include security test cases, edge cases, and validation tests."),
-    ("human", "Generate unit tests for this code:\n{refactored_code}")
-])
+data_refactorer_system = SystemMessage(content="You are a Data Security Refactoring Expert. Implement security improvements for data processing, focusing on data sanitization, encryption, and secure data handling.")
 
+tester_system = SystemMessage(content="You are a Security Testing Expert. Generate comprehensive unit tests that include security test cases, edge cases, and validation tests.")
 
-def determine_code_type(task_input: str, code_content: str) -> str:
-    """
-    Enhanced code type detection using weighted scoring.
-    Analyzes both task description and generated code for accurate classification.
-    """
-    # Combine task and code for analysis
-    combined_text = f"{task_input} {code_content}".lower()
-
-    # Weighted scoring for better accuracy
-    scores = {"api": 0, "web": 0, "data": 0}
 
+# Weighted keyword indicators per code type, built once at import
+_CODE_TYPE_KEYWORDS = {
     # API indicators (REST APIs, endpoints, web services)
-    api_keywords = {
+    "api": {
         "api": 3, "rest": 3, "endpoint": 3, "fastapi": 3, "restful": 3,
         "json": 2, "request": 2, "response": 2, "route": 2, "service": 2,
         "authentication": 2, "authorization": 2, "validate": 2, "registration": 2,
         "post": 1, "get": 1, "put": 1, "delete": 1, "http": 1
-    }
-
+    },
     # Web frontend indicators (HTML, CSS, forms, DOM manipulation)
-    web_keywords = {
+    "web": {
         "html": 3, "css": 3, "javascript": 3, "dom": 3, "frontend": 3,
         "template": 2, "form": 2, "render": 2, "page": 2, "browser": 2,
         "flask": 1, "django": 1, "web": 1, "url": 1, "view": 1
-    }
-
+    },
     # Data processing indicators
-    data_keywords = {
+    "data": {
         "dataframe": 3, "pandas": 3, "csv": 3, "sql": 3, "database": 3,
         "query": 2, "table": 2, "schema": 2, "etl": 2, "analytics": 2,
         "data": 1, "processing": 1, "transform": 1, "load": 1
     }
+}
 
-    # Calculate scores
-    for keyword, weight in api_keywords.items():
-        if keyword in combined_text:
-            scores["api"] += weight
+_KEYWORD_WEIGHTS = tuple(
+    (keyword, code_type, weight)
+    for code_type, keywords in _CODE_TYPE_KEYWORDS.items()
+    for keyword, weight in keywords.items()
+)
 
-    for keyword, weight in web_keywords.items():
-        if keyword in combined_text:
-            scores["web"] += weight
 
-    for keyword, weight in data_keywords.items():
+@functools.lru_cache(maxsize=1024)
+def determine_code_type(task_input: str, code_content: str) -> str:
+    """
+    Enhanced code type detection using weighted scoring.
+    Analyzes both task description and generated code for accurate classification.
+    """
+    # Combine task and code for analysis
+    combined_text = f"{task_input} {code_content}".lower()
+
+    # Weighted scoring for better accuracy
+    scores = {"api": 0, "web": 0, "data": 0}
+
+    # Calculate scores in a single pass over the flattened keyword table
+    for keyword, code_type, weight in _KEYWORD_WEIGHTS:
         if keyword in combined_text:
-            scores["data"] += weight
+            scores[code_type] += weight
 
     # Determine winner
     max_score = max(scores.values())
@@ -105,29 +96,41 @@ def determine_code_type(task_input: str, code_content: str) -> str:
         return "general"
 
     # Get type with highest score
-    winning_type = max(scores, key=scores.get)
-
-    # Debug output
-    print(f"🔍 Code type analysis:")
-    print(f"   Task: '{task_input[:50]}...'")
-    print(
-        f"   Scores: API={scores['api']}, Web={scores['web']}, Data={scores['data']}")
-    print(f"   Decision: {winning_type.upper()}")
-
-    return winning_type
-
-
-def coder_agent(state: CodeReviewState) -> CodeReviewState:
-    response = llm.invoke(coder_prompt.format_messages(input=state["input"]))
+    return max(scores, key=scores.get)
+
+
+async def coder_agent(state: CodeReviewState, config: RunnableConfig) -> CodeReviewState:
+    # Stream the code so it shows up while the rest is still being generated;
+    # concurrent runs switch the echo off so their tokens don't interleave
+    echo = config.get("configurable", {}).get("echo_stream", True)
+    chunks = []
+    pending = []
+    last_flush = time.monotonic()
+    async for chunk in llm.astream([coder_system, HumanMessage(content=state["input"])]):
+        chunks.append(chunk.content)
+        pending.append(chunk.content)
+        if echo and time.monotonic() - last_flush >= STREAM_FLUSH_SECONDS:
+            print("".join(pending), end="", flush=True)
+            pending.clear()
+            last_flush = time.monotonic()
+    if echo:
+        print("".join(pending), flush=True)
+    code = "".join(chunks)
 
     # Enhanced code type detection
-    code_type = determine_code_type(state["input"], response.content)
+    code_type = determine_code_type(state["input"], code)
+
+    # Debug output lives here so the memoised detector stays side-effect free
+    print(f"🔍 Code type analysis:")
+    print(f"   Task: '{state['input'][:50]}...'")
+    print(f"   Decision: {code_type.upper()}")
 
-    return {"code": response.content, "code_type": code_type}
+    return {"code": code, "code_type": code_type}
 
 
-def reviewer_agent(state: CodeReviewState) -> CodeReviewState:
-    response = llm.invoke(reviewer_prompt.format_messages(code=state["code"]))
+async def reviewer_agent(state: CodeReviewState) -> CodeReviewState:
+    response = await review_llm.ainvoke([reviewer_system, HumanMessage(
+        content=f"Review this code for security issues:\n{state['code']}")])
     return {"review": response.content}
 
 
@@ -144,86 +147,94 @@ def determine_refactorer_route(state: CodeReviewState) -> str:
         return "api_refactorer"  # Default fallback
 
 
-def web_refactorer_agent(state: CodeReviewState) -> CodeReviewState:
-    response = llm.invoke(web_refactorer_prompt.format_messages(
-        code=state["code"], review=state["review"]))
+async def web_refactorer_agent(state: CodeReviewState) -> CodeReviewState:
+    response = await llm.ainvoke([web_refactorer_system, HumanMessage(
+        content=f"Original web code:\n{state['code']}\n\nSecurity review:\n{state['review']}\n\nRefactor for web security:")])
     return {"refactored_code": response.content}
 
 
-def api_refactorer_agent(state: CodeReviewState) -> CodeReviewState:
-    response = llm.invoke(api_refactorer_prompt.format_messages(
-        code=state["code"], review=state["review"]))
+async def api_refactorer_agent(state: CodeReviewState) -> CodeReviewState:
+    response = await llm.ainvoke([api_refactorer_system, HumanMessage(
+        content=f"Original API code:\n{state['code']}\n\nSecurity review:\n{state['review']}\n\nRefactor for API security:")])
     return {"refactored_code": response.content}
 
 
-def data_refactorer_agent(state: CodeReviewState) -> CodeReviewState:
-    response = llm.invoke(data_refactorer_prompt.format_messages(
-        code=state["code"], review=state["review"]))
+async def data_refactorer_agent(state: CodeReviewState) -> CodeReviewState:
+    response = await llm.ainvoke([data_refactorer_system, HumanMessage(
+        content=f"Original data processing code:\n{state['code']}\n\nSecurity review:\n{state['review']}\n\nRefactor for data security:")])
     return {"refactored_code": response.content}
 
 
-def tester_agent(state: CodeReviewState) -> CodeReviewState:
-    response = llm.invoke(tester_prompt.format_messages(
-        refactored_code=state["refactored_code"]))
+async def tester_agent(state: CodeReviewState) -> CodeReviewState:
+    response = await llm.ainvoke([tester_system, HumanMessage(
+        content=f"Generate unit tests for this code:\n{state['refactored_code']}")])
     return {"tests": response.content}
 
 
-builder = StateGraph(CodeReviewState)
-builder.add_node("coder", coder_agent)
-builder.add_node("reviewer", reviewer_agent)
-builder.add_node("web_refactorer", web_refactorer_agent)
-builder.add_node("api_refactorer", api_refactorer_agent)
-builder.add_node("data_refactorer", data_refactorer_agent)
-builder.add_node("tester", tester_agent)
-
-builder.add_edge(START, "coder")
-builder.add_edge("coder", "reviewer")
-builder.add_conditional_edges(
-    "reviewer",
-    determine_refactorer_route,
-    {
-        "web_refactorer": "web_refactorer",
-        "api_refactorer": "api_refactorer",
-        "data_refactorer": "data_refactorer"
-    }
-)
-builder.add_edge("web_refactorer", "tester")
-builder.add_edge("api_refactorer", "tester")
-builder.add_edge("data_refactorer", "tester")
-builder.add_edge("tester", END)
-
-workflow = builder.compile()
-
-if __name__ == "__main__":
-    # Test cases to verify improved code type detection
-    test_cases = [
-        "Write a secure API function that validates email addresses and handles user registration with proper input validation",
-        "Create a web page with HTML forms for user login and CSS styling",
-        "Build a data processing pipeline that reads CSV files and transforms them into a SQL database"
-    ]
-
-    # Run the main API task
-    task = test_cases[0]  # API task
-
+@functools.lru_cache(maxsize=1)
+def get_workflow():
+    # Built on first use, so importing the module doesn't compile the graph
+    builder = StateGraph(CodeReviewState)
+    builder.add_node("coder", coder_agent)
+    builder.add_node("reviewer", reviewer_agent)
+    builder.add_node("web_refactorer", web_refactorer_agent)
+    builder.add_node("api_refactorer", api_refactorer_agent)
+    builder.add_node("data_refactorer", data_refactorer_agent)
+    builder.add_node("tester", tester_agent)
+
+    builder.add_edge(START, "coder")
+    builder.add_edge("coder", "reviewer")
+    builder.add_conditional_edges(
+        "reviewer",
+        determine_refactorer_route,
+        {
+            "web_refactorer": "web_refactorer",
+            "api_refactorer": "api_refactorer",
+            "data_refactorer": "data_refactorer"
+        }
+    )
+    builder.add_edge("web_refactorer", "tester")
+    builder.add_edge("api_refactorer", "tester")
+    builder.add_edge("data_refactorer", "tester")
+    builder.add_edge("tester", END)
+
+    return builder.compile()
+
+
+# Test cases to verify improved code type detection
+TEST_CASES = [
+    "Write a secure API function that validates email addresses and handles user registration with proper input validation",
+    "Create a web page with HTML forms for user login and CSS styling",
+    "Build a data processing pipeline that reads CSV files and transforms them into a SQL database"
+]
+
+
+async def main(test_cases: List[str]):
     print("Running security-focused sequential workflow...")
-    print(f"📋 Task: {task}")
-    result = workflow.invoke({"input": task})
-
-    print(f"\n🔍 Code type detected: {result.get('code_type', 'unknown')}")
-    print(f"🛡️ Security review completed")
-    print(
-        f"🔧 Refactored using {result.get('code_type', 'general')} security specialist")
-    print(f"✅ Security tests generated")
-
-    codebase = SequentialCodebase("01_sequential_workflow", task)
-    codebase.generate(result)
+    for task in test_cases:
+        print(f"📋 Task: {task}")
+
+    # The pipelines are independent, so run them side by side; a single task
+    # streams its code, several would interleave their tokens
+    results = await get_workflow().abatch(
+        [{"input": task} for task in test_cases],
+        config={"configurable": {"echo_stream": len(test_cases) == 1}})
+
+    for i, (task, result) in enumerate(zip(test_cases, results), 1):
+        print(f"\nTest {i}: {task}")
+        print(f"🔍 Code type detected: {result.get('code_type', 'unknown')}")
+        print(f"🛡️ Security review completed")
+        print(
+            f"🔧 Refactored using {result.get('code_type', 'general')} security specialist")
+        print(f"✅ Security tests generated")
+
+        # Folders are timestamped to the second, so number each run's output
+        codebase = SequentialCodebase(f"01_sequential_workflow_{i}", task)
+        codebase.generate(result)
 
     print("=== SECURITY WORKFLOW COMPLETED ===")
 
-    # Optional: Test other task types (commented out to avoid multiple runs)
-    # print("\n" + "="*60)
-    # print("🧪 TESTING OTHER TASK TYPES:")
-    # for i, test_task in enumerate(test_cases[1:], 2):
-    #     print(f"\nTest {i}: {test_task}")
-    #     test_result = workflow.invoke({"input": test_task})
-    #     print(f"Result: {test_result.get('code_type', 'unknown')} specialist selected")
+
+if __name__ == "__main__":
+    # A task given on the command line runs alone with its code streamed
+    asyncio.run(main(sys.argv[1:2] or TEST_CASES))
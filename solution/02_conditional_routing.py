@@ -1,16 +1,20 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage, HumanMessage
 from langgraph.graph import StateGraph, START, END
+from pydantic import BaseModel
 from typing import TypedDict, Literal, List
+import asyncio
+import functools
 from dotenv import load_dotenv
-from utils import ConditionalCodebase
+from utils import ConditionalCodebase, compact_code, enable_llm_cache, get_llm, warm_up_llm_connection
 
 load_dotenv()
+enable_llm_cache()
 
 
 class CodeAnalysisState(TypedDict):
     input: str
     code: str
+    compact_code: str  # code without comments, for performance and database experts
     route_decision: str
     route_decisions: List[str]  # For multi-expert routing
     specialist_analysis: str
@@ -21,67 +25,43 @@ class CodeAnalysisState(TypedDict):
     final_report: str
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
+class RouterDecision(BaseModel):
+    routes: List[Literal["security", "performance", "database", "general"]]
 
-coder_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Senior Software Engineer. Write clean Python code, and ONLY output the Python code."),
-    ("human", "{input}")
-])
 
-router_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are an Intelligent Router. Analyze both the task description AND the code content to determine which experts should review it. Consider:\n- Security issues (auth, validation, encryption)\n- Performance concerns (algorithms, scalability)\n- Database operations (SQL, schema, queries)\n- General code quality\n\nFor complex code with multiple concerns, you can route to multiple experts. Respond with a comma-separated list from: 'security', 'performance', 'database', 'general'."),
-    ("human", "Task: {input}\n\nCode to route:\n{code}")
-])
+llm = get_llm()
+# The router only returns a short list of expert names
+router_llm = get_llm(max_tokens=64).with_structured_output(RouterDecision)
 
-security_expert_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Security Expert. Focus on vulnerabilities, authentication, authorization, input validation, and secure coding practices."),
-    ("human", "Provide security analysis for:\n{code}")
-])
+# System prompts never change, so build them once; only the human turn is per call
+coder_system = SystemMessage(content="You are a Senior Software Engineer. Write clean Python code, and ONLY output the Python code.")
 
-performance_expert_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Performance Expert. Focus on algorithmic complexity, optimization, resource usage, and scalability."),
-    ("human", "Provide performance analysis for:\n{code}")
-])
+router_system = SystemMessage(content="You are an Intelligent Router. Analyze both the task description AND the code content to determine which experts should review it. Consider:\n- Security issues (auth, validation, encryption)\n- Performance concerns (algorithms, scalability)\n- Database operations (SQL, schema, queries)\n- General code quality\n\nFor complex code with multiple concerns, you can route to multiple experts. Choose from: 'security', 'performance', 'database', 'general'.")
 
-general_expert_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a General Code Expert. Focus on code quality, maintainability, readability, and best practices."),
-    ("human", "Provide general code analysis for:\n{code}")
-])
+security_expert_system = SystemMessage(content="You are a Security Expert. Focus on vulnerabilities, authentication, authorization, input validation, and secure coding practices.")
 
-database_expert_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Database Expert. Focus on SQL optimization, schema design, query performance, data integrity, and database security."),
-    ("human", "Provide database analysis for:\n{code}")
-])
+performance_expert_system = SystemMessage(content="You are a Performance Expert. Focus on algorithmic complexity, optimization, resource usage, and scalability.")
 
-synthesis_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Technical Lead. Synthesize multiple specialist analyses into comprehensive actionable recommendations."),
-    ("human",
-     "Expert Analyses:\n{all_analyses}\n\nRouted to: {experts_consulted}\n\nProvide final integrated recommendations:")
-])
+general_expert_system = SystemMessage(content="You are a General Code Expert. Focus on code quality, maintainability, readability, and best practices.")
 
+database_expert_system = SystemMessage(content="You are a Database Expert. Focus on SQL optimization, schema design, query performance, data integrity, and database security.")
 
-def coder_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(coder_prompt.format_messages(input=state["input"]))
-    return {"code": response.content}
+synthesis_system = SystemMessage(content="You are a Technical Lead. Synthesize multiple specialist analyses into comprehensive actionable recommendations.")
 
 
-def router_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(router_prompt.format_messages(
-        input=state["input"],
-        code=state["code"]
-    ))
+async def coder_agent(state: CodeAnalysisState) -> CodeAnalysisState:
+    response = await llm.ainvoke([coder_system, HumanMessage(content=state["input"])])
+    return {"code": response.content, "compact_code": compact_code(response.content)}
 
-    # Parse multiple routes
-    routes_text = response.content.strip().lower()
-    routes = [r.strip() for r in routes_text.split(',')]
 
-    # Validate routes
-    valid_routes = []
-    for route in routes:
-        if route in ["security", "performance", "database", "general"]:
-            valid_routes.append(route)
+async def router_agent(state: CodeAnalysisState) -> CodeAnalysisState:
+    decision = await router_llm.ainvoke([router_system, HumanMessage(
+        content=f"Task: {state['input']}\n\nCode to route:\n{state['code']}")])
 
-    # Default to general if no valid routes
+    # The schema only admits known experts, so just drop repeats
+    valid_routes = list(dict.fromkeys(decision.routes))
+
+    # Default to general if no routes were chosen
     if not valid_routes:
         valid_routes = ["general"]
 
@@ -89,35 +69,54 @@ def router_agent(state: CodeAnalysisState) -> CodeAnalysisState:
     return {"route_decision": valid_routes[0], "route_decisions": valid_routes}
 
 
-def security_expert_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(
-        security_expert_prompt.format_messages(code=state["code"]))
+async def security_expert_agent(state: CodeAnalysisState) -> CodeAnalysisState:
+    response = await llm.ainvoke([security_expert_system, HumanMessage(
+        content=f"Provide security analysis for:\n{state['code']}")])
     print("🔒 Security expert analyzing code")
     return {"security_analysis": response.content}
 
 
-def performance_expert_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(
-        performance_expert_prompt.format_messages(code=state["code"]))
+async def performance_expert_agent(state: CodeAnalysisState) -> CodeAnalysisState:
+    response = await llm.ainvoke([performance_expert_system, HumanMessage(
+        content=f"Provide performance analysis for:\n{state['compact_code']}")])
     print("⚡ Performance expert analyzing code")
     return {"performance_analysis": response.content}
 
 
-def general_expert_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(
-        general_expert_prompt.format_messages(code=state["code"]))
+async def general_expert_agent(state: CodeAnalysisState) -> CodeAnalysisState:
+    response = await llm.ainvoke([general_expert_system, HumanMessage(
+        content=f"Provide general code analysis for:\n{state['code']}")])
     print("📋 General expert analyzing code")
     return {"general_analysis": response.content}
 
 
-def database_expert_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(
-        database_expert_prompt.format_messages(code=state["code"]))
+async def database_expert_agent(state: CodeAnalysisState) -> CodeAnalysisState:
+    response = await llm.ainvoke([database_expert_system, HumanMessage(
+        content=f"Provide database analysis for:\n{state['compact_code']}")])
     print("🗄️ Database expert analyzing code")
     return {"database_analysis": response.content}
 
 
-def synthesis_agent(state: CodeAnalysisState) -> CodeAnalysisState:
+EXPERT_AGENTS = {
+    "security": security_expert_agent,
+    "performance": performance_expert_agent,
+    "database": database_expert_agent,
+    "general": general_expert_agent,
+}
+
+
+async def specialists_agent(state: CodeAnalysisState) -> CodeAnalysisState:
+    """Run every routed expert concurrently and merge their analyses"""
+    routes = state.get("route_decisions", [
+                       state.get("route_decision", "general")])
+    # Each expert runs once even if the router repeats it
+    routes = list(dict.fromkeys(routes))
+    results = await asyncio.gather(
+        *[EXPERT_AGENTS[route](state) for route in routes])
+    return {key: value for result in results for key, value in result.items()}
+
+
+async def synthesis_agent(state: CodeAnalysisState) -> CodeAnalysisState:
     # Collect all available analyses
     analyses = []
     experts_used = []
@@ -147,123 +146,54 @@ def synthesis_agent(state: CodeAnalysisState) -> CodeAnalysisState:
 
     all_analyses = "\n\n".join(analyses)
 
-    response = llm.invoke(synthesis_prompt.format_messages(
-        all_analyses=all_analyses,
-        experts_consulted=", ".join(experts_used)
-    ))
+    # A single specialist leaves nothing to merge, so there is no final report
+    # beyond its analysis
+    if len(analyses) == 1:
+        print(
+            f"🎯 Synthesis skipped - only the {experts_used[0]} expert was consulted")
+        return {"final_report": "", "specialist_analysis": all_analyses}
+
+    response = await llm.ainvoke([synthesis_system, HumanMessage(
+        content=f"Expert Analyses:\n{all_analyses}\n\nRouted to: {', '.join(experts_used)}\n\nProvide final integrated recommendations:")])
 
     print(
         f"🎯 Synthesis complete - consulted {', '.join(experts_used)} experts")
     return {"final_report": response.content, "specialist_analysis": all_analyses}
 
 
-def route_to_specialists(state: CodeAnalysisState) -> List[str]:
-    """Route to multiple specialists based on multi-expert routing decisions"""
-    routes = state.get("route_decisions", [
-                       state.get("route_decision", "general")])
-    return [f"{route}_expert" for route in routes]
+@functools.lru_cache(maxsize=1)
+def get_workflow():
+    # Built on first use, so importing the module doesn't compile the graph
+    builder = StateGraph(CodeAnalysisState)
+    builder.add_node("coder", coder_agent)
+    builder.add_node("router", router_agent)
+    builder.add_node("specialists", specialists_agent)
+    builder.add_node("synthesis", synthesis_agent)
 
+    builder.add_edge(START, "coder")
+    builder.add_edge("coder", "router")
+    builder.add_edge("router", "specialists")
+    builder.add_edge("specialists", "synthesis")
+    builder.add_edge("synthesis", END)
 
-def determine_next_steps(state: CodeAnalysisState) -> str:
-    """Determine if we should continue to more experts or go to synthesis"""
-    routes = state.get("route_decisions", [])
-    completed_experts = []
+    return builder.compile()
+
+
+async def run_workflow(task: str) -> CodeAnalysisState:
+    # Every node calls the model through the async client, so open a second
+    # pooled connection while the coder holds the first; the router and the
+    # concurrent experts then find one ready
+    warm_up = asyncio.create_task(warm_up_llm_connection())
+    result = await get_workflow().ainvoke({"input": task})
+    await warm_up
+    return result
 
-    # Check which experts have completed
-    if state.get("security_analysis"):
-        completed_experts.append("security")
-    if state.get("performance_analysis"):
-        completed_experts.append("performance")
-    if state.get("database_analysis"):
-        completed_experts.append("database")
-    if state.get("general_analysis"):
-        completed_experts.append("general")
-
-    # Find next expert to route to
-    for route in routes:
-        if route not in completed_experts:
-            return f"{route}_expert"
-
-    # All experts completed, go to synthesis
-    return "synthesis"
-
-
-builder = StateGraph(CodeAnalysisState)
-builder.add_node("coder", coder_agent)
-builder.add_node("router", router_agent)
-builder.add_node("security_expert", security_expert_agent)
-builder.add_node("performance_expert", performance_expert_agent)
-builder.add_node("database_expert", database_expert_agent)
-builder.add_node("general_expert", general_expert_agent)
-builder.add_node("synthesis", synthesis_agent)
-
-builder.add_edge(START, "coder")
-builder.add_edge("coder", "router")
-builder.add_conditional_edges(
-    "router",
-    determine_next_steps,
-    {
-        "security_expert": "security_expert",
-        "performance_expert": "performance_expert",
-        "database_expert": "database_expert",
-        "general_expert": "general_expert",
-        "synthesis": "synthesis"
-    }
-)
-
-# Add conditional edges from each expert to either next expert or synthesis
-builder.add_conditional_edges(
-    "security_expert",
-    determine_next_steps,
-    {
-        "performance_expert": "performance_expert",
-        "database_expert": "database_expert",
-        "general_expert": "general_expert",
-        "synthesis": "synthesis"
-    }
-)
-
-builder.add_conditional_edges(
-    "performance_expert",
-    determine_next_steps,
-    {
-        "security_expert": "security_expert",
-        "database_expert": "database_expert",
-        "general_expert": "general_expert",
-        "synthesis": "synthesis"
-    }
-)
-
-builder.add_conditional_edges(
-    "database_expert",
-    determine_next_steps,
-    {
-        "security_expert": "security_expert",
-        "performance_expert": "performance_expert",
-        "general_expert": "general_expert",
-        "synthesis": "synthesis"
-    }
-)
-
-builder.add_conditional_edges(
-    "general_expert",
-    determine_next_steps,
-    {
-        "security_expert": "security_expert",
-        "performance_expert": "performance_expert",
-        "database_expert": "database_expert",
-        "synthesis": "synthesis"
-    }
-)
-builder.add_edge("synthesis", END)
-
-workflow = builder.compile()
 
 if __name__ == "__main__":
     task = "Write a secure API function that handles user authentication and stores data in a PostgreSQL database with proper validation and performance optimization"
 
     print("Running intelligent multi-expert routing...")
-    result = workflow.invoke({"input": task})
+    result = asyncio.run(run_workflow(task))
 
     experts_used = []
     if result.get("security_analysis"):
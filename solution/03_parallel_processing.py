@@ -1,125 +1,110 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage, HumanMessage
 from langgraph.graph import StateGraph, START, END
-from typing import TypedDict
+from typing import TypedDict, Annotated
+import asyncio
+import operator
+import openai
 from dotenv import load_dotenv
-from utils import ParallelCodebase
+from utils import ParallelCodebase, compact_code, enable_llm_cache, get_llm
 
 load_dotenv()
+enable_llm_cache()
 
 
 class CodeAnalysisState(TypedDict):
     input: str
     code: str
+    compact_code: str  # code without comments, for the performance analysis
     security_analysis: str
     performance_analysis: str
     style_analysis: str
     documentation_analysis: str
     general_fallback_analysis: str
     final_report: str
-    failed_agents: list
+    failed_agents: Annotated[list, operator.add]
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
+# Retry only transient API failures (rate limits, dropped connections and 5xx
+# responses), backing off with jitter between attempts; the client's own
+# retries are off so attempts aren't multiplied
+llm = get_llm(max_retries=0).with_retry(
+    retry_if_exception_type=(openai.RateLimitError, openai.APIConnectionError,
+                             openai.InternalServerError),
+    wait_exponential_jitter=True,
+    stop_after_attempt=3,
+)
 
-coder_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Senior Software Engineer. Write ONLY Python code - no bash commands, no installation instructions, just the Python implementation."),
-    ("human", "{input}")
-])
+# System prompts never change, so build them once; only the human turn is per call
+coder_system = SystemMessage(content="You are a Senior Software Engineer. Write ONLY Python code - no bash commands, no installation instructions, just the Python implementation.")
 
-security_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Security Expert. Analyse code for security vulnerabilities, input validation, and potential attack vectors."),
-    ("human", "Analyse this code for security issues:\n{code}")
-])
+security_system = SystemMessage(content="You are a Security Expert. Analyse code for security vulnerabilities, input validation, and potential attack vectors.")
 
-performance_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Performance Expert. Analyse code for efficiency, algorithmic complexity, and optimisation opportunities."),
-    ("human", "Analyse this code for performance issues:\n{code}")
-])
+performance_system = SystemMessage(content="You are a Performance Expert. Analyse code for efficiency, algorithmic complexity, and optimisation opportunities.")
 
-style_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Code Style Expert. Analyse code for PEP 8 compliance, naming conventions, and code organisation."),
-    ("human", "Analyse this code for style and readability issues:\n{code}")
-])
+style_system = SystemMessage(content="You are a Code Style Expert. Analyse code for PEP 8 compliance, naming conventions, and code organisation.")
 
-documentation_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Documentation Expert. Generate comprehensive docstrings, comments, and documentation for code."),
-    ("human", "Generate documentation and docstrings for this code:\n{code}")
-])
+documentation_system = SystemMessage(content="You are a Documentation Expert. Generate comprehensive docstrings, comments, and documentation for code.")
 
-general_fallback_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a General Code Expert providing fallback analysis. Provide comprehensive code review covering all aspects."),
-    ("human", "Provide general analysis for this code (fallback mode):\n{code}")
-])
+general_fallback_system = SystemMessage(content="You are a General Code Expert providing fallback analysis. Provide comprehensive code review covering all aspects.")
 
-synthesis_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Technical Lead. Synthesise analysis reports into actionable recommendations with priorities. IMPORTANT: Give security recommendations 2x weight in your final prioritization."),
-    ("human", "Analysis Reports:\n{all_analyses}\n\nFailed Agents (if any): {failed_agents}\n\nProvide weighted recommendations with security issues prioritized:")
-])
+synthesis_system = SystemMessage(content="You are a Technical Lead. Synthesise analysis reports into actionable recommendations with priorities. IMPORTANT: Give security recommendations 2x weight in your final prioritization.")
 
 
-def coder_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    response = llm.invoke(coder_prompt.format_messages(input=state["input"]))
-    return {"code": response.content}
+async def coder_agent(state: CodeAnalysisState) -> CodeAnalysisState:
+    response = await llm.ainvoke([coder_system, HumanMessage(content=state["input"])])
+    return {"code": response.content, "compact_code": compact_code(response.content)}
 
 
-def security_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    try:
-        response = llm.invoke(security_prompt.format_messages(code=state["code"]))
-        print("🔒 Security analysis completed")
-        return {"security_analysis": response.content}
-    except Exception as e:
-        print(f"⚠️ Security agent failed: {e}")
-        failed_agents = state.get("failed_agents", [])
-        failed_agents.append("security")
-        return {"failed_agents": failed_agents}
+# Each analysis: failure name, system prompt, human request, the state field
+# holding the code it reads, and the line printed when it completes. Only
+# performance reads the compacted code; the others review comments and layout
+ANALYSES = [
+    ("security", security_system, "Analyse this code for security issues:",
+     "code", "🔒 Security analysis completed"),
+    ("performance", performance_system, "Analyse this code for performance issues:",
+     "compact_code", "⚡ Performance analysis completed"),
+    ("style", style_system, "Analyse this code for style and readability issues:",
+     "code", "🎨 Style analysis completed"),
+    ("documentation", documentation_system, "Generate documentation and docstrings for this code:",
+     "code", "📝 Documentation analysis completed"),
+]
 
 
-def performance_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    try:
-        response = llm.invoke(performance_prompt.format_messages(code=state["code"]))
-        print("⚡ Performance analysis completed")
-        return {"performance_analysis": response.content}
-    except Exception as e:
-        print(f"⚠️ Performance agent failed: {e}")
-        failed_agents = state.get("failed_agents", [])
-        failed_agents.append("performance")
-        return {"failed_agents": failed_agents}
+async def analysis_agent(state: CodeAnalysisState) -> CodeAnalysisState:
+    """Run all four analyses as one batch, recording any that fail"""
+    results = await llm.abatch(
+        [[system, HumanMessage(content=f"{request}\n{state[code_field]}")]
+         for _, system, request, code_field, _ in ANALYSES],
+        return_exceptions=True)
 
+    update = {}
+    failed_agents = []
+    for (name, _, _, _, completed_message), result in zip(ANALYSES, results):
+        if isinstance(result, openai.OpenAIError):
+            print(f"⚠️ {name.capitalize()} agent failed: {result}")
+            failed_agents.append(name)
+        elif isinstance(result, Exception):
+            raise result
+        else:
+            print(completed_message)
+            update[f"{name}_analysis"] = result.content
 
-def style_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    try:
-        response = llm.invoke(style_prompt.format_messages(code=state["code"]))
-        print("🎨 Style analysis completed")
-        return {"style_analysis": response.content}
-    except Exception as e:
-        print(f"⚠️ Style agent failed: {e}")
-        failed_agents = state.get("failed_agents", [])
-        failed_agents.append("style")
-        return {"failed_agents": failed_agents}
-
-def documentation_agent(state: CodeAnalysisState) -> CodeAnalysisState:
-    try:
-        response = llm.invoke(documentation_prompt.format_messages(code=state["code"]))
-        print("📝 Documentation analysis completed")
-        return {"documentation_analysis": response.content}
-    except Exception as e:
-        print(f"⚠️ Documentation agent failed: {e}")
-        failed_agents = state.get("failed_agents", [])
-        failed_agents.append("documentation")
-        return {"failed_agents": failed_agents}
-
-def general_fallback_agent(state: CodeAnalysisState) -> CodeAnalysisState:
+    update["failed_agents"] = failed_agents
+    return update
+
+
+async def general_fallback_agent(state: CodeAnalysisState) -> CodeAnalysisState:
     try:
-        response = llm.invoke(general_fallback_prompt.format_messages(code=state["code"]))
+        response = await llm.ainvoke([general_fallback_system, HumanMessage(
+            content=f"Provide general analysis for this code (fallback mode):\n{state['code']}")])
         print("🔄 General fallback analysis completed")
         return {"general_fallback_analysis": response.content}
-    except Exception as e:
+    except openai.OpenAIError as e:
         print(f"⚠️ General fallback agent failed: {e}")
         return {"general_fallback_analysis": "Fallback analysis unavailable"}
 
 
-def synthesis_agent(state: CodeAnalysisState) -> CodeAnalysisState:
+async def synthesis_agent(state: CodeAnalysisState) -> CodeAnalysisState:
     # Collect all available analyses
     analyses = []
     failed_agents = state.get("failed_agents", [])
@@ -151,10 +136,9 @@ def synthesis_agent(state: CodeAnalysisState) -> CodeAnalysisState:
     
     all_analyses = "\n\n".join(analyses)
     
-    response = llm.invoke(synthesis_prompt.format_messages(
-        all_analyses=all_analyses,
-        failed_agents=", ".join(failed_agents) if failed_agents else "None"
-    ))
+    failed_list = ", ".join(failed_agents) if failed_agents else "None"
+    response = await llm.ainvoke([synthesis_system, HumanMessage(
+        content=f"Analysis Reports:\n{all_analyses}\n\nFailed Agents (if any): {failed_list}\n\nProvide weighted recommendations with security issues prioritized:")])
     
     print(f"🎯 Weighted synthesis completed (Security 2x priority)")
     if failed_agents:
@@ -173,47 +157,17 @@ def check_for_failures(state: CodeAnalysisState) -> str:
 
 builder = StateGraph(CodeAnalysisState)
 builder.add_node("coder", coder_agent)
-builder.add_node("security_agent", security_agent)
-builder.add_node("performance_agent", performance_agent)
-builder.add_node("style_agent", style_agent)
-builder.add_node("documentation_agent", documentation_agent)
+builder.add_node("analysis", analysis_agent)
 builder.add_node("general_fallback", general_fallback_agent)
 builder.add_node("synthesis", synthesis_agent)
 
-# All experts run in parallel after coder
+# All experts run as one batch after coder
 builder.add_edge(START, "coder")
-builder.add_edge("coder", "security_agent")
-builder.add_edge("coder", "performance_agent")
-builder.add_edge("coder", "style_agent")
-builder.add_edge("coder", "documentation_agent")
+builder.add_edge("coder", "analysis")
 
-# All agents check for failures before proceeding
-builder.add_conditional_edges(
-    "security_agent",
-    check_for_failures,
-    {
-        "general_fallback": "general_fallback",
-        "synthesis": "synthesis"
-    }
-)
-builder.add_conditional_edges(
-    "performance_agent",
-    check_for_failures,
-    {
-        "general_fallback": "general_fallback",
-        "synthesis": "synthesis"
-    }
-)
-builder.add_conditional_edges(
-    "style_agent",
-    check_for_failures,
-    {
-        "general_fallback": "general_fallback",
-        "synthesis": "synthesis"
-    }
-)
+# Route to the fallback if any analysis failed
 builder.add_conditional_edges(
-    "documentation_agent",
+    "analysis",
     check_for_failures,
     {
         "general_fallback": "general_fallback",
@@ -230,7 +184,8 @@ if __name__ == "__main__":
     task = "Write a secure web API endpoint that processes user file uploads, validates them, and stores metadata in a database with proper error handling"
 
     print("Running parallel processing with fallback protection...")
-    result = workflow.invoke({"input": task, "failed_agents": []})
+    result = asyncio.run(workflow.ainvoke(
+        {"input": task, "failed_agents": []}))
     
     # Display results
     completed_analyses = []
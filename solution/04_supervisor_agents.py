@@ -1,11 +1,13 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage, HumanMessage
 from langgraph.graph import StateGraph, START, END
-from typing import TypedDict, Literal
+from typing import TypedDict
+import asyncio
+import time
 from dotenv import load_dotenv
-from utils import SupervisorCodebase
+from utils import SupervisorCodebase, enable_llm_cache, get_llm
 
 load_dotenv()
+enable_llm_cache()
 
 
 class SupervisorState(TypedDict):
@@ -17,48 +19,29 @@ class SupervisorState(TypedDict):
     completed_agents: list
     final_analysis: str
     task_type: str
-    next_agent: str
+    selected_agents: list
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
+llm = get_llm()
 
-coder_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Senior Software Engineer. Write ONLY production-ready Python code with proper error handling - no bash commands, no installation instructions, just the Python implementation."),
-    ("human", "{input}")
-])
+# Batch streamed tokens so the console isn't written once per token
+STREAM_FLUSH_SECONDS = 0.05
 
-supervisor_prompt = ChatPromptTemplate.from_messages([
-    ("system",
-     "Analyse task type and code content. For authentication tasks, prioritise security expert first. Choose next expert: 'security_expert', 'quality_expert', 'database_expert', or 'complete'. Completed: {completed_agents}. Task type: {task_type}"),
-    ("human", "Code needs analysis:\n{code}")
-])
+# System prompts never change, so build them once; only the human turn is per call
+coder_system = SystemMessage(content="You are a Senior Software Engineer. Write ONLY production-ready Python code with proper error handling - no bash commands, no installation instructions, just the Python implementation.")
 
-security_expert_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Security Expert. Focus on vulnerabilities and security best practices. If quality report available, consider those findings too."),
-    ("human",
-     "Security analysis for:\n{code}\n\nQuality report context: {quality_report}")
-])
+security_expert_system = SystemMessage(content="You are a Security Expert. Focus on vulnerabilities and security best practices. If quality report available, consider those findings too.")
 
-quality_expert_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Quality Expert. Review code structure and maintainability."),
-    ("human", "Quality analysis for:\n{code}")
-])
+quality_expert_system = SystemMessage(content="You are a Quality Expert. Review code structure and maintainability.")
 
-database_expert_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Database Expert. Review SQL queries, schema design, and database interactions for security, performance, and best practices."),
-    ("human", "Database analysis for:\n{code}")
-])
+database_expert_system = SystemMessage(content="You are a Database Expert. Review SQL queries, schema design, and database interactions for security, performance, and best practices.")
 
-synthesis_prompt = ChatPromptTemplate.from_messages([
-    ("system", "Create final analysis summary with key recommendations based on all expert reports."),
-    ("human",
-     "Security: {security_report}\n\nQuality: {quality_report}\n\nDatabase: {database_report}")
-])
+synthesis_system = SystemMessage(content="Create final analysis summary with key recommendations based on all expert reports.")
 
 
 def coder_agent(state: SupervisorState) -> SupervisorState:
     print("👨‍💻 Generating code...")
-    response = llm.invoke(coder_prompt.format_messages(input=state["input"]))
+    response = llm.invoke([coder_system, HumanMessage(content=state["input"])])
 
     task_lower = state["input"].lower()
     if any(keyword in task_lower for keyword in ["authentication", "login", "auth", "password", "security"]):
@@ -79,65 +62,73 @@ def coder_agent(state: SupervisorState) -> SupervisorState:
     }
 
 
+DATABASE_KEYWORDS = ["sql", "database", "query", "schema", "db"]
+
+
 def supervisor_agent(state: SupervisorState) -> SupervisorState:
-    completed = state.get("completed_agents", [])
     code = state.get("code", "")
     task_type = state.get("task_type", "general")
 
-    print(f"🎯 Supervisor: Task type: {task_type}, Completed: {completed}")
+    print(f"🎯 Supervisor: Task type: {task_type}")
 
-    if task_type == "authentication" and "security_expert" not in completed:
+    # Pick every expert up front; none of them reads another's report
+    experts = []
+    if task_type == "authentication":
         print("🔒 Routing to security expert (authentication priority)")
-        return {"next_agent": "security_expert"}
-    elif any(keyword in code.lower() for keyword in ["sql", "database", "query", "schema", "db"]) and "database_expert" not in completed:
+        experts.append("security_expert")
+    if any(keyword in code.lower() for keyword in DATABASE_KEYWORDS):
         print("🗄️ Routing to database expert (code content analysis)")
-        return {"next_agent": "database_expert"}
-    elif "security_expert" not in completed:
+        experts.append("database_expert")
+    if "security_expert" not in experts:
         print("🔒 Routing to security expert")
-        return {"next_agent": "security_expert"}
-    elif "quality_expert" not in completed:
-        print("✨ Routing to quality expert")
-        return {"next_agent": "quality_expert"}
-    else:
-        print("✅ All experts consulted, proceeding to synthesis")
-        return {"next_agent": "complete"}
+        experts.append("security_expert")
+    print("✨ Routing to quality expert")
+    experts.append("quality_expert")
 
+    return {"selected_agents": experts}
 
-def security_expert_agent(state: SupervisorState) -> SupervisorState:
+
+async def security_expert_agent(state: SupervisorState) -> SupervisorState:
     print("🔒 Security expert analyzing code...")
     quality_context = state.get(
         "quality_report", "No quality analysis available yet")
-    response = llm.invoke(security_expert_prompt.format_messages(
-        code=state["code"],
-        quality_report=quality_context
-    ))
-    completed = state.get("completed_agents", []).copy()
-    completed.append("security_expert")
-    print(f"✅ Security analysis complete. Agents now completed: {completed}")
-    return {"security_report": response.content, "completed_agents": completed}
+    response = await llm.ainvoke([security_expert_system, HumanMessage(
+        content=f"Security analysis for:\n{state['code']}\n\nQuality report context: {quality_context}")])
+    return {"security_report": response.content}
 
 
-def quality_expert_agent(state: SupervisorState) -> SupervisorState:
+async def quality_expert_agent(state: SupervisorState) -> SupervisorState:
     print("✨ Quality expert analyzing code...")
-    response = llm.invoke(
-        quality_expert_prompt.format_messages(code=state["code"]))
-    completed = state.get("completed_agents", []).copy()
-    completed.append("quality_expert")
-    print(f"✅ Quality analysis complete. Agents now completed: {completed}")
-    return {"quality_report": response.content, "completed_agents": completed}
+    response = await llm.ainvoke([quality_expert_system, HumanMessage(
+        content=f"Quality analysis for:\n{state['code']}")])
+    return {"quality_report": response.content}
 
 
-def database_expert_agent(state: SupervisorState) -> SupervisorState:
+async def database_expert_agent(state: SupervisorState) -> SupervisorState:
     print("🗄️ Database expert analyzing code...")
-    response = llm.invoke(
-        database_expert_prompt.format_messages(code=state["code"]))
-    completed = state.get("completed_agents", []).copy()
-    completed.append("database_expert")
-    print(f"✅ Database analysis complete. Agents now completed: {completed}")
-    return {"database_report": response.content, "completed_agents": completed}
+    response = await llm.ainvoke([database_expert_system, HumanMessage(
+        content=f"Database analysis for:\n{state['code']}")])
+    return {"database_report": response.content}
+
+
+EXPERT_AGENTS = {
+    "security_expert": security_expert_agent,
+    "quality_expert": quality_expert_agent,
+    "database_expert": database_expert_agent,
+}
 
 
-def synthesis_agent(state: SupervisorState) -> SupervisorState:
+async def run_experts(state: SupervisorState) -> SupervisorState:
+    """Run the supervisor's chosen experts concurrently and merge their reports"""
+    experts = state["selected_agents"]
+    results = await asyncio.gather(
+        *[EXPERT_AGENTS[expert](state) for expert in experts])
+    print(f"✅ Expert analyses complete. Agents now completed: {experts}")
+    reports = {key: value for result in results for key, value in result.items()}
+    return {**reports, "completed_agents": experts}
+
+
+async def synthesis_agent(state: SupervisorState) -> SupervisorState:
     print("📊 Synthesizing expert reports...")
     security_report = state.get("security_report", "Not analysed")
     quality_report = state.get("quality_report", "Not analysed")
@@ -147,44 +138,32 @@ def synthesis_agent(state: SupervisorState) -> SupervisorState:
           f"Quality: {'✅' if quality_report != 'Not analysed' else '❌'}, "
           f"Database: {'✅' if database_report != 'Not analysed' else '❌'}")
 
-    response = llm.invoke(synthesis_prompt.format_messages(
-        security_report=security_report,
-        quality_report=quality_report,
-        database_report=database_report
-    ))
-    return {"final_analysis": response.content}
-
-
-def route_to_expert(state: SupervisorState) -> Literal["security_expert", "quality_expert", "database_expert", "synthesis"]:
-    next_agent = state.get("next_agent", "complete")
-    if next_agent == "complete":
-        return "synthesis"
-    return next_agent
+    # Stream the summary so it shows up while the rest is still being generated
+    chunks = []
+    pending = []
+    last_flush = time.monotonic()
+    async for chunk in llm.astream([synthesis_system, HumanMessage(
+        content=f"Security: {security_report}\n\nQuality: {quality_report}\n\nDatabase: {database_report}")]):
+        chunks.append(chunk.content)
+        pending.append(chunk.content)
+        if time.monotonic() - last_flush >= STREAM_FLUSH_SECONDS:
+            print("".join(pending), end="", flush=True)
+            pending.clear()
+            last_flush = time.monotonic()
+    print("".join(pending), flush=True)
+    return {"final_analysis": "".join(chunks)}
 
 
 builder = StateGraph(SupervisorState)
 builder.add_node("coder", coder_agent)
 builder.add_node("supervisor", supervisor_agent)
-builder.add_node("security_expert", security_expert_agent)
-builder.add_node("quality_expert", quality_expert_agent)
-builder.add_node("database_expert", database_expert_agent)
+builder.add_node("experts", run_experts)
 builder.add_node("synthesis", synthesis_agent)
 
 builder.add_edge(START, "coder")
 builder.add_edge("coder", "supervisor")
-builder.add_conditional_edges(
-    "supervisor",
-    route_to_expert,
-    {
-        "security_expert": "security_expert",
-        "quality_expert": "quality_expert",
-        "database_expert": "database_expert",
-        "synthesis": "synthesis"
-    }
-)
-builder.add_edge("security_expert", "supervisor")
-builder.add_edge("quality_expert", "supervisor")
-builder.add_edge("database_expert", "supervisor")
+builder.add_edge("supervisor", "experts")
+builder.add_edge("experts", "synthesis")
 builder.add_edge("synthesis", END)
 
 workflow = builder.compile()
@@ -193,7 +172,7 @@ if __name__ == "__main__":
     task = "Write a user authentication system with database integration"
 
     print("Starting supervised code review...")
-    result = workflow.invoke({"input": task})
+    result = asyncio.run(workflow.ainvoke({"input": task}))
 
     codebase = SupervisorCodebase("04_supervisor_agents", task)
     codebase.generate(result)
@@ -1,97 +1,127 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage, HumanMessage
 from langgraph.graph import StateGraph, START, END
-from typing import TypedDict, Literal
+from pydantic import BaseModel, Field
+from typing import TypedDict, Literal, Annotated, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import operator
+import re
 from dotenv import load_dotenv
-from utils import EvaluatorCodebase
+from utils import EvaluatorCodebase, enable_llm_cache, get_llm
 
 load_dotenv()
+enable_llm_cache()
 
 
 class OptimisationState(TypedDict):
     input: str
-    code: list
-    security_score: int
-    performance_score: int
-    readability_score: int
-    score: int
+    # Every version is kept for the audit trail; nodes return only the new one
+    code: Annotated[list, operator.add]
+    # Scores are None when the current version was rejected without scoring
+    security_score: Optional[int]
+    performance_score: Optional[int]
+    readability_score: Optional[int]
+    score: Optional[int]
     scores: int
     iteration_count: int
     final_code: str
+    scores_by_hash: Dict[str, Tuple[int, int, int]]
+    fast_track: bool
+    rejection_reason: str
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
+class MultiScore(BaseModel):
+    security: int = Field(ge=1, le=10)
+    performance: int = Field(ge=1, le=10)
+    readability: int = Field(ge=1, le=10)
+
+
+llm = get_llm()
+# Scores are a tiny JSON object, so cap the scorer's output
+score_llm = get_llm(max_tokens=64).with_structured_output(MultiScore)
 
 # Configuration constants
 QUALITY_THRESHOLD = 7
 MAX_ITERATIONS = 3
 FAST_TRACK_THRESHOLD = 8
 
-generator_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a Senior Software Engineer. Write ONLY Python code - no bash commands, no installation instructions, just the Python implementation."),
-    ("human", "{input}")
-])
+# Cheap check run before the evaluator call
+DEFINITION_PATTERN = re.compile(r"\b(?:def|class)\b")
+NO_DEFINITION_REASON = "no function or class definition"
+
+# System prompts never change, so build them once; only the human turn is per call
+generator_system = SystemMessage(content="You are a Senior Software Engineer. Write ONLY Python code - no bash commands, no installation instructions, just the Python implementation.")
+
+evaluator_system = SystemMessage(content="Rate this code from 1-10 on three criteria. SECURITY: input validation, injection risks, authentication. PERFORMANCE: algorithmic complexity, efficiency, resource usage. READABILITY: naming, structure, documentation, clarity.")
 
-security_evaluator_prompt = ChatPromptTemplate.from_messages([
-    ("system", "Rate this code's SECURITY from 1-10. Consider input validation, injection risks, authentication. Respond with just the number."),
-    ("human", "Code:\n{code}")
-])
+optimiser_system = SystemMessage(content="Improve code based on the weakest scoring area. Focus on the lowest score area.")
 
-performance_evaluator_prompt = ChatPromptTemplate.from_messages([
-    ("system", "Rate this code's PERFORMANCE from 1-10. Consider algorithmic complexity, efficiency, resource usage. Respond with just the number."),
-    ("human", "Code:\n{code}")
-])
+alternate_optimiser_system = SystemMessage(content="Improve code with a focus on performance: algorithmic complexity, efficiency, and resource usage. Keep security and readability intact.")
 
-readability_evaluator_prompt = ChatPromptTemplate.from_messages([
-    ("system", "Rate this code's READABILITY from 1-10. Consider naming, structure, documentation, clarity. Respond with just the number."),
-    ("human", "Code:\n{code}")
-])
 
-optimiser_prompt = ChatPromptTemplate.from_messages([
-    ("system", "Improve code based on the weakest scoring area. Focus on the lowest score area."),
-    ("human", "Code:\n{code}\n\nScores - Security: {security}, Performance: {performance}, Readability: {readability}\n\nImprove the weakest area:")
-])
+def hash_code(code: str) -> str:
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+async def score_code(code: str) -> Optional[Tuple[int, int, int]]:
+    """Score code for security, performance and readability, or None if rejected"""
+    if not DEFINITION_PATTERN.search(code):
+        # No function or class at all - reject without spending tokens
+        return None
+    # One structured call returns all three scores
+    result = await score_llm.ainvoke([evaluator_system, HumanMessage(
+        content=f"Code:\n{code}")])
+    return result.security, result.performance, result.readability
 
 
 def code_generator(state: OptimisationState) -> OptimisationState:
-    response = llm.invoke(
-        generator_prompt.format_messages(input=state["input"]))
+    response = llm.invoke([generator_system, HumanMessage(content=state["input"])])
     return {
         "code": [response.content],
         "iteration_count": 0,
     }
 
 
-def multi_criteria_evaluator_agent(state: OptimisationState) -> OptimisationState:
+async def multi_criteria_evaluator_agent(state: OptimisationState) -> OptimisationState:
     current_code = state["code"][-1] if state["code"] else ""
     current_iteration = len(state["code"]) - 1
 
-    security_response = llm.invoke(
-        security_evaluator_prompt.format_messages(code=current_code))
-    performance_response = llm.invoke(
-        performance_evaluator_prompt.format_messages(code=current_code))
-    readability_response = llm.invoke(
-        readability_evaluator_prompt.format_messages(code=current_code))
-
-    try:
-        security_score = int(security_response.content.strip())
-    except:
-        security_score = 5
-
-    try:
-        performance_score = int(performance_response.content.strip())
-    except:
-        performance_score = 5
-
-    try:
-        readability_score = int(readability_response.content.strip())
-    except:
-        readability_score = 5
-
+    # Scores are kept per run, keyed by code hash
+    scores_by_hash = state.get("scores_by_hash", {})
+    code_hash = hash_code(current_code)
+    if code_hash in scores_by_hash:
+        # The optimiser already scored this version, or handed back an old one
+        print("♻️ Code already scored - reusing its scores")
+        code_scores = scores_by_hash[code_hash]
+    else:
+        code_scores = await score_code(current_code)
+        if code_scores is not None:
+            scores_by_hash = {**scores_by_hash, code_hash: code_scores}
+
+    if code_scores is None:
+        # Nothing to grade, so record no scores and send it to the optimiser
+        print(f"🚫 Rejected without scoring: {NO_DEFINITION_REASON}")
+        unscored = state.get("scores", [])
+        unscored.append(None)
+        return {
+            "security_score": None,
+            "performance_score": None,
+            "readability_score": None,
+            "score": None,
+            "scores": unscored,
+            "scores_by_hash": scores_by_hash,
+            "fast_track": False,
+            "rejection_reason": NO_DEFINITION_REASON,
+        }
+
+    security_score, performance_score, readability_score = code_scores
     lowest_score = min(security_score, performance_score, readability_score)
     lowest_scores = state.get("scores", [])
     lowest_scores.append(lowest_score)
 
+    # A strong first draft goes straight to finalise instead of the optimiser
+    fast_track = current_iteration == 0 and lowest_score >= FAST_TRACK_THRESHOLD
+
     print(
         f"📊 Scores - Security: {security_score}, Performance: {performance_score}, Readability: {readability_score} (Lowest: {lowest_score})")
 
@@ -101,23 +131,47 @@ def multi_criteria_evaluator_agent(state: OptimisationState) -> OptimisationStat
         "readability_score": readability_score,
         "score": lowest_score,
         "scores": lowest_scores,
+        "scores_by_hash": scores_by_hash,
+        "fast_track": fast_track,
+        "rejection_reason": "",
     }
 
 
-def optimiser_agent(state: OptimisationState) -> OptimisationState:
+async def optimiser_agent(state: OptimisationState) -> OptimisationState:
     current_code = state["code"][-1] if state["code"] else ""
+    if state.get("score") is None:
+        scores = f"Rejected without scoring: {state['rejection_reason']}"
+    else:
+        scores = f"Scores - Security: {state['security_score']}, Performance: {state['performance_score']}, Readability: {state['readability_score']}"
+
+    # Draft two candidates at once and keep whichever scores better, so each
+    # round explores two strategies for the wall-clock cost of one
+    responses = await asyncio.gather(
+        llm.ainvoke([optimiser_system, HumanMessage(
+            content=f"Code:\n{current_code}\n\n{scores}\n\nImprove the weakest area:")]),
+        llm.ainvoke([alternate_optimiser_system, HumanMessage(
+            content=f"Code:\n{current_code}\n\n{scores}\n\nImprove performance:")]),
+    )
+    candidates = [response.content for response in responses]
+    candidate_scores = await asyncio.gather(
+        *[score_code(candidate) for candidate in candidates])
+
+    # Record both so the evaluator reuses the kept candidate's scores
+    scores_by_hash = dict(state.get("scores_by_hash", {}))
+    for candidate, candidate_score in zip(candidates, candidate_scores):
+        if candidate_score is not None:
+            scores_by_hash[hash_code(candidate)] = candidate_score
+
+    # Rejected candidates rank below any scored one; ties go to the weakest-area candidate
+    lowest = [min(score) if score is not None else 0 for score in candidate_scores]
+    best = max(range(len(candidates)), key=lambda i: lowest[i])
+    print(
+        f"🔀 Kept the {'weakest-area' if best == 0 else 'performance'} candidate (lowest scores: {lowest[0] or 'rejected'} vs {lowest[1] or 'rejected'})")
 
-    response = llm.invoke(optimiser_prompt.format_messages(
-        code=current_code,
-        security=state["security_score"],
-        performance=state["performance_score"],
-        readability=state["readability_score"]
-    ))
-
-    updated_code_list = state["code"] + [response.content]
     return {
-        "code": updated_code_list,
-        "iteration_count": state["iteration_count"] + 1
+        "code": [candidates[best]],
+        "iteration_count": state["iteration_count"] + 1,
+        "scores_by_hash": scores_by_hash,
     }
 
 
@@ -140,6 +194,14 @@ def should_continue_optimisation(state: OptimisationState) -> Literal["optimise"
         print(f"🚀 Fast track complete! Initial score was ≥ 8, optimization skipped")
         return "finalise"
 
+    # A rejected version has no score to judge, so it goes back for a rewrite
+    if lowest_score is None:
+        if iteration_count >= max_iterations:
+            print(
+                f"Max iterations ({max_iterations}) reached. Final version was rejected: {state['rejection_reason']}.")
+            return "finalise"
+        return "optimise"
+
     if iteration_count >= max_iterations:
         print(
             f"Max iterations ({max_iterations}) reached. Final score: {lowest_score}/10. Quality threshold {quality_threshold}/10 not reached.")
@@ -175,7 +237,7 @@ if __name__ == "__main__":
     task = "Write a secure REST API endpoint for file upload with comprehensive validation, error handling, and performance optimization"
 
     print("Starting iterative optimisation...")
-    result = workflow.invoke({"input": task})
+    result = asyncio.run(workflow.ainvoke({"input": task}))
 
     codebase = EvaluatorCodebase("05_evaluator_optimiser", task)
     codebase.generate(result)
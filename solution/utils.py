@@ -1,24 +1,244 @@
+import io
 import os
 import re
 import datetime
 import shutil
 import time
 import functools
-from typing import Dict, Any, Optional, Callable, List
+import hashlib
+import math
+import sqlite3
+import threading
+import tokenize
+from typing import Dict, Any, Optional, Callable, List, Tuple
+
+import httpx
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.embeddings import Embeddings
+from langchain_core.globals import get_llm_cache, set_llm_cache
+from langchain_core.load import dumps, loads
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+
+_CODE_BLOCK_RE = re.compile(r'```(?:python)?\s*(.*?)\s*```', re.DOTALL)
+
+_GENERATED_AT_FORMAT = "%Y-%m-%d %H:%M:%S"
+_SEQUENTIAL_FOOTER = "---\n*Generated using LangGraph Sequential Workflow Pattern*\n"
+_CONDITIONAL_FOOTER = "---\n*Generated using LangGraph Conditional Routing Pattern*\n"
+_PARALLEL_FOOTER = "---\n*Generated using LangGraph Parallel Processing Pattern*\n"
+_SUPERVISOR_FOOTER = "---\n*Generated using LangGraph Supervisor Agents Pattern*\n"
+_EVALUATOR_FOOTER = "---\n*Generated using LangGraph Evaluator-Optimiser Pattern*\n"
+_ORCHESTRATOR_FOOTER = "---\n*Generated using LangGraph Orchestrator-Worker Pattern*\n"
+
+
+class SQLiteLLMCache(BaseCache):
+    """Exact-match LLM response cache keyed on a SHA-256 of model settings and prompt"""
+
+    def __init__(self, database_path: str = ".llm_cache.db"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(database_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, generations TEXT)")
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        # llm_string carries the model name and temperature, prompt the serialised messages
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT generations FROM llm_cache WHERE key = ?",
+                (self._key(prompt, llm_string),)).fetchone()
+        return loads(row[0]) if row else None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, generations) VALUES (?, ?)",
+                (self._key(prompt, llm_string), dumps(list(return_val))))
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_cache")
+
+
+def _cosine_similarity(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class SemanticLLMCache(BaseCache):
+    """LLM cache that also answers prompts embedding close to an earlier one.
+
+    The global exact cache is checked first and kept up to date, so reruns
+    are still answered from disk; similarity only covers its misses.
+    """
+
+    def __init__(self, embeddings: Embeddings, threshold: float = 0.95):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Tuple[List[float], RETURN_VAL_TYPE]]] = {}
+        # Vectors computed on a miss, reused when the fresh answer is stored
+        self._pending: Dict[str, List[float]] = {}
+
+    def _exact_cache(self) -> Optional[BaseCache]:
+        exact_cache = get_llm_cache()
+        return exact_cache if exact_cache is not self else None
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        exact_cache = self._exact_cache()
+        if exact_cache is not None:
+            generations = exact_cache.lookup(prompt, llm_string)
+            if generations is not None:
+                return generations
+
+        vector = self.embeddings.embed_query(prompt)
+        with self._lock:
+            for cached_vector, generations in self._entries.get(llm_string, []):
+                if _cosine_similarity(vector, cached_vector) >= self.threshold:
+                    break
+            else:
+                self._pending[prompt] = vector
+                return None
+        # Store the borrowed answer under this exact prompt for the next run
+        if exact_cache is not None:
+            exact_cache.update(prompt, llm_string, generations)
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        exact_cache = self._exact_cache()
+        if exact_cache is not None:
+            exact_cache.update(prompt, llm_string, return_val)
+        with self._lock:
+            vector = self._pending.pop(prompt, None)
+        if vector is None:
+            vector = self.embeddings.embed_query(prompt)
+        with self._lock:
+            self._entries.setdefault(llm_string, []).append((vector, return_val))
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+
+
+def enable_llm_cache(database_path: str = ".llm_cache.db") -> None:
+    """Serve repeated prompts from a local cache; only meaningful with temperature=0"""
+    set_llm_cache(SQLiteLLMCache(database_path))
+
+
+# One connection pool for every model client, so calls reuse warm connections
+# The pool size also caps requests in flight: extra calls wait for a free
+# connection instead of running into the rate limit and backing off
+_MAX_CONCURRENT_REQUESTS = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+_HTTP_LIMITS = httpx.Limits(max_connections=_MAX_CONCURRENT_REQUESTS,
+                            max_keepalive_connections=_MAX_CONCURRENT_REQUESTS)
+
+# Fixed sampling seed, so a prompt answered fresh matches what an earlier
+# (possibly since cleared) cache run returned
+_LLM_SEED = 42
+
+
+@functools.lru_cache(maxsize=1)
+def _http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    return httpx.Client(limits=_HTTP_LIMITS), httpx.AsyncClient(limits=_HTTP_LIMITS)
+
+
+@functools.lru_cache(maxsize=None)
+def get_llm(model: str = "gpt-4.1-nano", semantic_cache: bool = False,
+            max_tokens: Optional[int] = None, max_retries: int = 2) -> ChatOpenAI:
+    """Shared ChatOpenAI for a model, built on first use over the pooled clients.
+
+    With semantic_cache, near-duplicate prompts (e.g. reviews of barely
+    changed code) reuse an earlier answer on top of the global exact cache.
+    max_tokens caps routing and scoring heads that only emit a few tokens.
+    max_retries=0 leaves retrying to a with_retry wrapper.
+    """
+    http_client, http_async_client = _http_clients()
+    cache = SemanticLLMCache(OpenAIEmbeddings(
+        model="text-embedding-3-small")) if semantic_cache else None
+    return ChatOpenAI(model=model, temperature=0, seed=_LLM_SEED, max_retries=max_retries,
+                      cache=cache, max_tokens=max_tokens, http_client=http_client,
+                      http_async_client=http_async_client)
+
+
+async def warm_up_llm_connection() -> None:
+    """Open a pooled connection to the API before the first model call needs it.
+
+    Lists models rather than prompting, so it spends no tokens and can't be
+    answered from the LLM cache. Failures are left to the real call to report.
+    """
+    base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    headers = {"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY', '')}"}
+    try:
+        await _http_clients()[1].get(f"{base_url}/models", headers=headers)
+    except httpx.HTTPError:
+        pass
 
 
 def extract_code_from_response(response_text: str) -> str:
     if not response_text:
         return ""
 
-    code_block_pattern = r'```(?:python)?\s*(.*?)\s*```'
-    match = re.search(code_block_pattern, response_text, re.DOTALL)
+    # Most review/report fields carry no fences, so skip the regex for them
+    if "```" not in response_text:
+        return response_text.strip()
+
+    match = _CODE_BLOCK_RE.search(response_text)
     return match.group(1).strip() if match else response_text.strip()
 
 
+def compact_code(response_text: str) -> str:
+    """Code from a response with comments and blank lines removed.
+
+    Used for analysis prompts that don't need the commentary. String
+    literals are left intact; text that doesn't tokenize as Python is
+    returned unchanged.
+    """
+    code = extract_code_from_response(response_text)
+    try:
+        tokens = [token for token in tokenize.generate_tokens(io.StringIO(code).readline)
+                  if token.type != tokenize.COMMENT]
+        stripped = tokenize.untokenize(tokens)
+    except (tokenize.TokenError, SyntaxError):
+        return response_text
+
+    # Lines inside multi-line strings are content, blank or not
+    string_lines = set()
+    for token in tokens:
+        if token.type == tokenize.STRING:
+            string_lines.update(range(token.start[0] + 1, token.end[0] + 1))
+
+    return "\n".join(line if number in string_lines else line.rstrip()
+                     for number, line in enumerate(stripped.splitlines(), 1)
+                     if number in string_lines or line.strip())
+
+
 def sanitise_filename(text: str) -> str:
-    sanitised = re.sub(r'[^\w\s-]', '', text).strip()
-    return re.sub(r'[-\s]+', '_', sanitised).lower()
+    # Single pass: drop non-word characters and collapse runs of spaces and
+    # dashes into one underscore. Whitespace-only runs at either end are
+    # trimmed, but a run containing a dash still becomes an underscore.
+    chars = []
+    in_separator = False
+    has_dash = False
+    for ch in text:
+        if ch.isalnum() or ch == '_':
+            if in_separator and (chars or has_dash):
+                chars.append('_')
+            in_separator = has_dash = False
+            chars.append(ch)
+        elif ch == '-':
+            in_separator = has_dash = True
+        elif ch.isspace():
+            in_separator = True
+    if in_separator and has_dash:
+        chars.append('_')
+    return ''.join(chars).lower()
 
 
 class CodebaseGenerator:
@@ -27,21 +247,28 @@ class CodebaseGenerator:
         self.task = task
         self.timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         self.folder_name = f"generated/{pattern_name}_{self.timestamp}"
+        self._prefix = self.folder_name + os.sep
+        self._created = False
 
     def create_folder(self) -> str:
-        os.makedirs(self.folder_name, exist_ok=True)
+        if not self._created:
+            os.makedirs(self.folder_name, exist_ok=True)
+            self._created = True
         return self.folder_name
 
     def write_code_file(self, filename: str, content: str, extension: str) -> None:
-        code = extract_code_from_response(content)
+        self.write_raw_code_file(
+            filename, extract_code_from_response(content), extension)
+
+    def write_raw_code_file(self, filename: str, code: str, extension: str) -> None:
+        """Write code that has already been extracted from its fences"""
         if code:
-            filepath = os.path.join(
-                self.folder_name, f"{filename}.{extension}")
+            filepath = f"{self._prefix}{filename}.{extension}"
             with open(filepath, 'w', encoding='utf-8') as f:
                 f.write(code)
 
     def write_text_file(self, filename: str, content: str) -> None:
-        filepath = os.path.join(self.folder_name, filename)
+        filepath = self._prefix + filename
         with open(filepath, 'w', encoding='utf-8') as f:
             f.write(content)
 
@@ -50,51 +277,60 @@ class SequentialCodebase(CodebaseGenerator):
     def generate(self, result: Dict[str, Any]) -> None:
         self.create_folder()
 
-        self.write_code_file("original_code", result.get('code', '',), "py")
-        self.write_code_file(
-            "refactored_code", result.get('refactored_code', ''), "py")
+        tests = result.get('tests', '')
+        review = result.get('review', 'No review available')
+
+        code_body = extract_code_from_response(result.get('code', ''))
+        refactored_body = extract_code_from_response(
+            result.get('refactored_code', ''))
+        tests_body = extract_code_from_response(tests)
 
-        if result.get('tests'):
-            self.write_code_file("tests", result.get('tests', ''), "py")
+        self.write_raw_code_file("original_code", code_body, "py")
+        self.write_raw_code_file("refactored_code", refactored_body, "py")
+
+        if tests:
+            self.write_raw_code_file("tests", tests_body, "py")
 
         tests_section = ""
-        if result.get('tests'):
+        if tests:
             tests_section = f"""
 
 ## Unit Tests
 ```python
-{extract_code_from_response(result.get('tests', 'No unit tests generated'))}
+{tests_body}
 ```"""
 
-        files_generated = "- `original_code.py` - Initial implementation\n- `refactored_code.py` - Improved version based on review"
-        if result.get('tests'):
-            files_generated += "\n- `tests.py` - Comprehensive test suite"
+        files_list = [
+            "- `original_code.py` - Initial implementation",
+            "- `refactored_code.py` - Improved version based on review"
+        ]
+        if tests:
+            files_list.append("- `tests.py` - Comprehensive test suite")
+        files_generated = "\n".join(files_list)
 
         audit_content = f"""# Sequential Workflow Audit Trail
 
-**Generated:** {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}  
+**Generated:** {datetime.datetime.now().strftime(_GENERATED_AT_FORMAT)}  
 **Task:** {self.task}  
 **Pattern:** Sequential Workflow
 
 ## Original Code
 ```python
-{extract_code_from_response(result.get('code', 'No code generated'))}
+{code_body or 'No code generated'}
 ```
 
 ## Review Feedback
-{result.get('review', 'No review available')}
+{review}
 
 ## Refactored Code
 ```python
-{extract_code_from_response(result.get('refactored_code', 'No refactored code available'))}
+{refactored_body or 'No refactored code available'}
 ```{tests_section}
 
 ## Files Generated
 {files_generated}
 
----
-*Generated using LangGraph Sequential Workflow Pattern*
-"""
+{_SEQUENTIAL_FOOTER}"""
         self.write_text_file("AUDIT_TRAIL.md", audit_content)
         print(f"✅ Sequential codebase created in: {self.folder_name}/")
 
@@ -102,13 +338,19 @@ class SequentialCodebase(CodebaseGenerator):
 class ConditionalCodebase(CodebaseGenerator):
     def generate(self, result: Dict[str, Any]) -> None:
         self.create_folder()
-        self.write_code_file("generated_code", result.get('code', ''), "py")
+
+        code_body = extract_code_from_response(result.get('code', ''))
+        self.write_raw_code_file("generated_code", code_body, "py")
 
         # Exercise 1: Database expert detection
         route_decision = result.get("route_decision", "unknown")
         route_decisions = result.get("route_decisions", [route_decision])
         specialist_analysis = result.get("specialist_analysis", "")
         final_report = result.get("final_report", "")
+        security_analysis = result.get("security_analysis")
+        performance_analysis = result.get("performance_analysis")
+        database_analysis = result.get("database_analysis")
+        general_analysis = result.get("general_analysis")
 
         # Exercise 2: Smart routing - check if task description was used
         smart_routing_used = "input" in str(result.get(
@@ -120,22 +362,22 @@ class ConditionalCodebase(CodebaseGenerator):
 
         # Collect all expert analyses
         expert_analyses = []
-        if result.get("security_analysis"):
+        if security_analysis:
             experts_consulted.append("Security")
             expert_analyses.append(
-                f"### Security Expert Analysis\n{result['security_analysis']}")
-        if result.get("performance_analysis"):
+                f"### Security Expert Analysis\n{security_analysis}")
+        if performance_analysis:
             experts_consulted.append("Performance")
             expert_analyses.append(
-                f"### Performance Expert Analysis\n{result['performance_analysis']}")
-        if result.get("database_analysis"):
+                f"### Performance Expert Analysis\n{performance_analysis}")
+        if database_analysis:
             experts_consulted.append("Database")
             expert_analyses.append(
-                f"### Database Expert Analysis\n{result['database_analysis']}")
-        if result.get("general_analysis"):
+                f"### Database Expert Analysis\n{database_analysis}")
+        if general_analysis:
             experts_consulted.append("General")
             expert_analyses.append(
-                f"### General Expert Analysis\n{result['general_analysis']}")
+                f"### General Expert Analysis\n{general_analysis}")
 
         # Build specialist section with enhanced information
         if multiple_experts and expert_analyses:
@@ -159,11 +401,11 @@ class ConditionalCodebase(CodebaseGenerator):
 
         # Exercise enhancements section
         enhancements_section = ""
-        if multiple_experts or smart_routing_used or result.get("database_analysis"):
+        if multiple_experts or smart_routing_used or database_analysis:
             enhancements_section = f"""
 ## Exercise Implementations Detected
 """
-            if result.get("database_analysis"):
+            if database_analysis:
                 enhancements_section += "- ✅ **Exercise 1**: Database expert added and utilized\n"
             if smart_routing_used:
                 enhancements_section += "- ✅ **Exercise 2**: Smart routing considers task description + code content\n"
@@ -185,27 +427,31 @@ class ConditionalCodebase(CodebaseGenerator):
             workflow_steps.append(
                 f"3. **{route_decision.title()} Expert** → Provided domain-specific analysis")
 
-        workflow_steps.append(
-            "4. **Synthesis Agent** → Created final integrated recommendations")
+        # Synthesis is skipped when a single expert's analysis is the report
+        if final_report:
+            workflow_steps.append(
+                "4. **Synthesis Agent** → Created final integrated recommendations")
 
         # Dynamic routing flow
         if multiple_experts:
-            routing_flow = f"Coder → Router → [{', '.join(experts_consulted)} Experts] → Synthesis"
+            routing_flow = f"Coder → Router → [{', '.join(experts_consulted)} Experts]"
         else:
-            routing_flow = f"Coder → Router → {route_decision.title()} Expert → Synthesis"
+            routing_flow = f"Coder → Router → {route_decision.title()} Expert"
+        if final_report:
+            routing_flow += " → Synthesis"
 
         files_generated = "- `generated_code.py` - Code routed through specialist review"
 
         audit_content = f"""# Conditional Routing Audit Trail
 
-**Generated:** {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+**Generated:** {datetime.datetime.now().strftime(_GENERATED_AT_FORMAT)}
 **Task:** {self.task}
 **Pattern:** Conditional Routing
 **Routing Strategy:** {"Multi-expert routing" if multiple_experts else "Single expert routing"}
 
 ## Generated Code
 ```python
-{extract_code_from_response(result.get('code', 'No code generated'))}
+{code_body or 'No code generated'}
 ```
 
 ## Routing Decision
@@ -223,9 +469,7 @@ class ConditionalCodebase(CodebaseGenerator):
 ## Files Generated
 {files_generated}
 
----
-*Generated using LangGraph Conditional Routing Pattern*
-"""
+{_CONDITIONAL_FOOTER}"""
         self.write_text_file("AUDIT_TRAIL.md", audit_content)
         print(
             f"✅ Conditional routing codebase created in: {self.folder_name}/")
@@ -235,11 +479,13 @@ class ParallelCodebase(CodebaseGenerator):
     def generate(self, result: Dict[str, Any]) -> None:
         self.create_folder()
 
-        self.write_code_file("main_code", result.get('code', ''), "py")
+        code_body = extract_code_from_response(result.get('code', ''))
+        documentation_analysis = result.get('documentation_analysis')
+        self.write_raw_code_file("main_code", code_body, "py")
 
         synthesis_content = f"""# Code Analysis Synthesis Report
 
-**Generated:** {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}  
+**Generated:** {datetime.datetime.now().strftime(_GENERATED_AT_FORMAT)}  
 **Task:** {self.task}  
 **Analysis Method:** Parallel Expert Review
 
@@ -247,27 +493,25 @@ class ParallelCodebase(CodebaseGenerator):
 
 {result.get('final_report', 'No synthesis report available')}
 
----
-*Generated using LangGraph Parallel Processing Pattern*
-"""
+{_PARALLEL_FOOTER}"""
         self.write_text_file("SYNTHESIS_REPORT.md", synthesis_content)
 
         documentation_section = ""
-        if result.get('documentation_analysis'):
+        if documentation_analysis:
             documentation_section = f"""
 
 ### Documentation Analysis
-{result.get('documentation_analysis', 'No documentation analysis available')}"""
+{documentation_analysis}"""
 
         audit_content = f"""# Parallel Processing Audit Trail
 
-**Generated:** {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}  
+**Generated:** {datetime.datetime.now().strftime(_GENERATED_AT_FORMAT)}  
 **Task:** {self.task}  
 **Pattern:** Parallel Processing
 
 ## Generated Code
 ```python
-{extract_code_from_response(result.get('code', 'No code generated'))}
+{code_body or 'No code generated'}
 ```
 
 ## Expert Analysis Reports
@@ -285,9 +529,7 @@ class ParallelCodebase(CodebaseGenerator):
 - `main_code.py` - Analysed implementation
 - `SYNTHESIS_REPORT.md` - **KEY DELIVERABLE:** Aggregated expert recommendations
 
----
-*Generated using LangGraph Parallel Processing Pattern*
-"""
+{_PARALLEL_FOOTER}"""
         self.write_text_file("AUDIT_TRAIL.md", audit_content)
         print(
             f"✅ Parallel processing codebase created in: {self.folder_name}/")
@@ -298,19 +540,26 @@ class SupervisorCodebase(CodebaseGenerator):
     def generate(self, result: Dict[str, Any]) -> None:
         self.create_folder()
 
-        self.write_code_file("main_code", result.get('code', ''), "py")
+        code_body = extract_code_from_response(result.get('code', ''))
+        task_type = result.get('task_type')
+        completed_agents = result.get('completed_agents', [])
+        security_report = result.get('security_report')
+        quality_report = result.get('quality_report')
+        database_report = result.get('database_report')
+
+        self.write_raw_code_file("main_code", code_body, "py")
 
         task_analysis_section = ""
-        if result.get('task_type'):
+        if task_type:
             task_analysis_section = f"""
 
 ## Task Analysis
-- **Task Type:** {result['task_type']}
-- **Routing Strategy:** {'Priority security routing' if result['task_type'] == 'authentication' else 'Standard expert routing'}"""
+- **Task Type:** {task_type}
+- **Routing Strategy:** {'Priority security routing' if task_type == 'authentication' else 'Standard expert routing'}"""
 
         final_analysis_content = f"""# Expert Analysis & Recommendations
 
-**Generated:** {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}  
+**Generated:** {datetime.datetime.now().strftime(_GENERATED_AT_FORMAT)}  
 **Task:** {self.task}  
 **Analysis Method:** Supervised Expert Consultation{task_analysis_section}
 
@@ -320,53 +569,49 @@ class SupervisorCodebase(CodebaseGenerator):
 
 ## Expert Consultation Process
 
-**Agents Consulted:** {', '.join(result.get('completed_agents', []))}
+**Agents Consulted:** {', '.join(completed_agents)}
 
 ### Supervisor Decision Log
 {result.get('supervisor_notes', 'No supervisor decisions recorded')}
 
----
-*Generated using LangGraph Supervisor Agents Pattern*
-"""
+{_SUPERVISOR_FOOTER}"""
         self.write_text_file("EXPERT_ANALYSIS.md", final_analysis_content)
 
-        completed_agents = result.get('completed_agents', [])
         reports_section = ""
 
-        if result.get('security_report'):
-            context_note = " (with quality context)" if result.get(
-                'quality_report') else ""
-            reports_section += f"### Security Expert Report{context_note}\n{result['security_report']}\n\n"
-        if result.get('quality_report'):
-            reports_section += f"### Quality Expert Report\n{result['quality_report']}\n\n"
-        if result.get('database_report'):
-            reports_section += f"### Database Expert Report\n{result['database_report']}\n\n"
+        if security_report:
+            context_note = " (with quality context)" if quality_report else ""
+            reports_section += f"### Security Expert Report{context_note}\n{security_report}\n\n"
+        if quality_report:
+            reports_section += f"### Quality Expert Report\n{quality_report}\n\n"
+        if database_report:
+            reports_section += f"### Database Expert Report\n{database_report}\n\n"
 
         supervisor_notes = "Supervisor coordinated expert consultation based on task analysis and code content."
-        if result.get('task_type') == 'authentication':
+        if task_type == 'authentication':
             supervisor_notes += " Priority routing applied for authentication task - security expert consulted first."
-        if result.get('database_report'):
+        if database_report:
             supervisor_notes += " Database expert added based on code analysis showing SQL/database operations."
 
         smart_routing_section = ""
-        if result.get('database_report') or result.get('task_type') == 'authentication':
+        if database_report or task_type == 'authentication':
             smart_routing_section = f"""
 
 ## Smart Routing Features
 - **Content-based routing:** Database expert consulted based on code analysis
-- **Task-type prioritisation:** {'Security-first routing for authentication tasks' if result.get('task_type') == 'authentication' else 'Standard routing applied'}
+- **Task-type prioritisation:** {'Security-first routing for authentication tasks' if task_type == 'authentication' else 'Standard routing applied'}
 - **Expert collaboration:** Security expert reviewed quality findings"""
 
         audit_content = f"""# Supervisor Agents Audit Trail
 
-**Generated:** {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}  
+**Generated:** {datetime.datetime.now().strftime(_GENERATED_AT_FORMAT)}  
 **Task:** {self.task}  
 **Pattern:** Supervisor Agents
 **Agents Consulted:** {', '.join(completed_agents)}
 
 ## Generated Code
 ```python
-{extract_code_from_response(result.get('code', 'No code generated'))}
+{code_body or 'No code generated'}
 ```
 
 ## Supervisor Decision Process
@@ -380,9 +625,7 @@ class SupervisorCodebase(CodebaseGenerator):
 - `main_code.py` - Expert-reviewed implementation  
 - `EXPERT_ANALYSIS.md` - **KEY DELIVERABLE:** Synthesised expert recommendations
 
----
-*Generated using LangGraph Supervisor Agents Pattern*
-"""
+{_SUPERVISOR_FOOTER}"""
         self.write_text_file("AUDIT_TRAIL.md", audit_content)
         print(f"✅ Supervisor agents codebase created in: {self.folder_name}/")
         print(f"🎯 Key deliverable: {self.folder_name}/EXPERT_ANALYSIS.md")
@@ -392,47 +635,60 @@ class EvaluatorCodebase(CodebaseGenerator):
     def generate(self, result: Dict[str, Any]) -> None:
         self.create_folder()
 
-        # Write final code
-        self.write_code_file("final_code", result.get(
-            'final_code', result.get('code', '')), "py")
-
-        final_score = result.get('score', 'N/A')
-        iteration_count = result.get('iteration_count', 0)
         code_list = result.get('code', [])
+        final_code = result.get('final_code', code_list)
+        final_score = result.get('score')
+        if final_score is None:
+            final_score = 'N/A'
+        iteration_count = result.get('iteration_count', 0)
         scores = result.get('scores', [])
 
+        final_body = extract_code_from_response(final_code)
+        code_bodies = []
+        if isinstance(code_list, list):
+            code_bodies = [extract_code_from_response(code_version)
+                           for code_version in code_list]
+
+        # Write final code
+        self.write_raw_code_file("final_code", final_body, "py")
+
         # Write each iteration as separate Python file
-        files_generated = "- `final_code.py` - Iteratively optimised implementation"
-        if isinstance(code_list, list) and len(code_list) > 0:
-            for i, code_version in enumerate(code_list):
+        files_list = ["- `final_code.py` - Iteratively optimised implementation"]
+        if code_bodies:
+            for i, code_body in enumerate(code_bodies):
                 if i == 0:
                     filename = "initial_code"
-                    files_generated += f"\n- `initial_code.py` - Original implementation"
+                    files_list.append(
+                        "- `initial_code.py` - Original implementation")
                 else:
                     filename = f"iteration_{i}"
-                    files_generated += f"\n- `iteration_{i}.py` - Iteration {i} improvement"
+                    files_list.append(
+                        f"- `iteration_{i}.py` - Iteration {i} improvement")
 
-                self.write_code_file(filename, code_version, "py")
+                self.write_raw_code_file(filename, code_body, "py")
+        files_generated = "\n".join(files_list)
 
         # Determine completion reason
         completion_reason = "Max iterations reached" if iteration_count >= 3 else "Quality threshold reached"
 
         # Build iterations section
         iterations_section = ""
-        if isinstance(code_list, list) and len(code_list) > 1:
-            iterations_section = "\n## Code Evolution\n\n"
-            for i, code_version in enumerate(code_list):
+        if len(code_bodies) > 1:
+            iteration_parts = ["\n## Code Evolution\n\n"]
+            for i, code_body in enumerate(code_bodies):
                 iteration_label = "Initial Code" if i == 0 else f"Iteration {i}"
                 score_info = ""
                 if i < len(scores):
-                    score_info = f" (Score: {scores[i]}/10)"
+                    # None marks a version rejected without scoring
+                    score_info = f" (Score: {scores[i]}/10)" if scores[i] is not None else " (Unscored)"
 
-                iterations_section += f"""### {iteration_label}{score_info}
+                iteration_parts.append(f"""### {iteration_label}{score_info}
 ```python
-{extract_code_from_response(code_version)}
+{code_body}
 ```
 
-"""
+""")
+            iterations_section = "".join(iteration_parts)
 
         history_section = f"""## Optimisation Summary
 - **Total Iterations:** {iteration_count}
@@ -443,7 +699,7 @@ class EvaluatorCodebase(CodebaseGenerator):
 
         audit_content = f"""# Evaluator-Optimiser Audit Trail
 
-**Generated:** {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}  
+**Generated:** {datetime.datetime.now().strftime(_GENERATED_AT_FORMAT)}  
 **Task:** {self.task}  
 **Pattern:** Evaluator-Optimiser
 **Total Iterations:** {iteration_count}
@@ -451,15 +707,13 @@ class EvaluatorCodebase(CodebaseGenerator):
 
 ## Final Code
 ```python
-{extract_code_from_response(result.get('final_code', result.get('code', 'No code generated')))}
+{final_body or 'No code generated'}
 ```
 
 {history_section}{iterations_section}## Files Generated
 {files_generated}
 
----
-*Generated using LangGraph Evaluator-Optimiser Pattern*
-"""
+{_EVALUATOR_FOOTER}"""
         self.write_text_file("AUDIT_TRAIL.md", audit_content)
         print(
             f"✅ Evaluator-optimiser codebase created in: {self.folder_name}/")
@@ -469,11 +723,12 @@ class OrchestratorCodebase(CodebaseGenerator):
     def extract_worker_outputs(self, result: Dict[str, Any]) -> Dict[str, str]:
         """Extract individual worker outputs by type from worker_outputs list"""
         worker_outputs = {}
+        outputs = result.get('worker_outputs')
 
-        if not result.get('worker_outputs'):
+        if not outputs:
             return worker_outputs
 
-        for output in result['worker_outputs']:
+        for output in outputs:
             if isinstance(output, str):
                 # Parse worker type from output prefix
                 if output.startswith('FRONTEND -'):
@@ -515,7 +770,7 @@ class OrchestratorCodebase(CodebaseGenerator):
             content = worker_outputs['backend']
             code_content = extract_code_from_response(content)
             if code_content:
-                self.write_code_file("api_endpoints", content, "py")
+                self.write_raw_code_file("api_endpoints", code_content, "py")
                 files_created.append("api_endpoints.py")
             else:
                 self.write_text_file("backend_design.md", content)
@@ -531,7 +786,8 @@ class OrchestratorCodebase(CodebaseGenerator):
                     self.write_text_file("login_form.html", code_content)
                     files_created.append("login_form.html")
                 else:
-                    self.write_code_file("frontend_components", content, "jsx")
+                    self.write_raw_code_file(
+                        "frontend_components", code_content, "jsx")
                     files_created.append("frontend_components.jsx")
             else:
                 self.write_text_file("frontend_design.md", content)
@@ -585,39 +841,44 @@ class OrchestratorCodebase(CodebaseGenerator):
     def generate(self, result: Dict[str, Any]) -> None:
         self.create_folder()
 
+        subtasks = result.get('subtasks', [])
+        raw_worker_outputs = result.get('worker_outputs', [])
+        final_body = extract_code_from_response(
+            result.get('final_result', ''))
+
         # Extract individual worker outputs and create specialized files
         worker_outputs = self.extract_worker_outputs(result)
         specialized_files = self.write_specialized_files(worker_outputs)
 
         # Write final synthesized code (keep for reference)
-        self.write_code_file(
-            "final_code", result.get('final_result', ''), "sql")
+        self.write_raw_code_file("final_code", final_body, "sql")
 
         subtasks_section = ""
-        if result.get('subtasks'):
-            subtasks_section = "\n## Task Breakdown\n\n"
-            for i, subtask in enumerate(result['subtasks'], 1):
+        if subtasks:
+            subtask_parts = ["\n## Task Breakdown\n\n"]
+            for i, subtask in enumerate(subtasks, 1):
                 if isinstance(subtask, dict):
                     deps = ", ".join(subtask.get('dependencies', [])) if subtask.get(
                         'dependencies') else "None"
                     priority = subtask.get('priority', 'N/A')
-                    subtasks_section += f"""### Subtask {i}: {subtask.get('name', f'Task {i}')}
+                    subtask_parts.append(f"""### Subtask {i}: {subtask.get('name', f'Task {i}')}
 **Type:** {subtask.get('type', 'Unknown')}  
 **Priority:** {priority}  
 **Dependencies:** {deps}  
 **Description:** {subtask.get('description', 'No description')}
 
-"""
+""")
                 else:
-                    subtasks_section += f"""### Subtask {i}
+                    subtask_parts.append(f"""### Subtask {i}
 {subtask}
 
-"""
+""")
+            subtasks_section = "".join(subtask_parts)
 
         worker_specialisation_section = ""
         worker_types = set()
-        if result.get('worker_outputs'):
-            for output in result['worker_outputs']:
+        if raw_worker_outputs:
+            for output in raw_worker_outputs:
                 if output.startswith('FRONTEND'):
                     worker_types.add('Frontend')
                 elif output.startswith('BACKEND'):
@@ -633,8 +894,11 @@ class OrchestratorCodebase(CodebaseGenerator):
 ## Worker Specialisation
 **Specialised workers used:** {', '.join(sorted(worker_types))}"""
 
+        has_dependencies = any(subtask.get('dependencies')
+                               for subtask in subtasks)
+
         dependency_handling_section = ""
-        if result.get('subtasks') and any(subtask.get('dependencies') for subtask in result.get('subtasks', [])):
+        if has_dependencies:
             dependency_handling_section = f"""
 
 ## Dependency Management
@@ -646,9 +910,9 @@ class OrchestratorCodebase(CodebaseGenerator):
         exercise_3_completed = False
 
         # Exercise 1: Smart task detection - check if subtasks have diverse types
-        if result.get('subtasks'):
+        if subtasks:
             task_types = set()
-            for subtask in result['subtasks']:
+            for subtask in subtasks:
                 if isinstance(subtask, dict) and subtask.get('type'):
                     task_types.add(subtask['type'])
             # Consider completed if we have specialized types beyond just 'implementation'
@@ -662,7 +926,7 @@ class OrchestratorCodebase(CodebaseGenerator):
             exercise_2_completed = True
 
         # Exercise 3: Dependency handling - check if subtasks have dependencies
-        if result.get('subtasks') and any(subtask.get('dependencies') for subtask in result.get('subtasks', [])):
+        if has_dependencies:
             exercise_3_completed = True
 
         # Exercise enhancements section
@@ -682,52 +946,51 @@ class OrchestratorCodebase(CodebaseGenerator):
                 enhancements_section += "- ✅ **Exercise 3**: Dependency handling implemented\n"
 
         worker_outputs_section = ""
-        if result.get('worker_outputs'):
-            worker_outputs_section = "\n## Worker Outputs\n\n"
-            for i, output in enumerate(result['worker_outputs'], 1):
-                worker_outputs_section += f"""### Worker {i} Output
+        if raw_worker_outputs:
+            output_parts = ["\n## Worker Outputs\n\n"]
+            for i, output in enumerate(raw_worker_outputs, 1):
+                output_parts.append(f"""### Worker {i} Output
 ```python
 {extract_code_from_response(output)}
 ```
 
-"""
+""")
+            worker_outputs_section = "".join(output_parts)
 
         orchestrator_report = f"""# Orchestrator Process Report
 
-**Generated:** {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}  
+**Generated:** {datetime.datetime.now().strftime(_GENERATED_AT_FORMAT)}  
 **Task:** {self.task}  
 **Analysis Method:** Dynamic Task Decomposition{worker_specialisation_section}{dependency_handling_section}{enhancements_section}
 
 ## Executive Summary
 
-The orchestrator successfully broke down the complex task into {len(result.get('subtasks', []))} manageable subtasks, executed them through specialised workers, and synthesised the results into a cohesive solution.
+The orchestrator successfully broke down the complex task into {len(subtasks)} manageable subtasks, executed them through specialised workers, and synthesised the results into a cohesive solution.
 
 ## Process Overview
 
 1. **Task Analysis**: Orchestrator analysed the input requirements
-2. **Dynamic Decomposition**: Created {len(result.get('subtasks', []))} specialised subtasks
+2. **Dynamic Decomposition**: Created {len(subtasks)} specialised subtasks
 3. **Dependency Resolution**: Executed subtasks in correct order
 4. **Specialised Execution**: Workers processed subtasks independently
 5. **Result Synthesis**: Combined worker outputs into final solution
 
 {subtasks_section}
 
----
-*Generated using LangGraph Orchestrator-Worker Pattern*
-"""
+{_ORCHESTRATOR_FOOTER}"""
         self.write_text_file("ORCHESTRATOR_REPORT.md", orchestrator_report)
 
         audit_content = f"""# Orchestrator-Worker Audit Trail
 
-**Generated:** {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}  
+**Generated:** {datetime.datetime.now().strftime(_GENERATED_AT_FORMAT)}  
 **Task:** {self.task}  
 **Pattern:** Orchestrator-Worker
-**Subtasks Created:** {len(result.get('subtasks', []))}
-**Workers Executed:** {len(result.get('worker_outputs', []))}
+**Subtasks Created:** {len(subtasks)}
+**Workers Executed:** {len(raw_worker_outputs)}
 
 ## Final Code
 ```python
-{extract_code_from_response(result.get('final_result', 'No code generated'))}
+{final_body or 'No code generated'}
 ```
 
 {subtasks_section}{enhancements_section}{worker_outputs_section}## Files Generated
@@ -735,9 +998,7 @@ The orchestrator successfully broke down the complex task into {len(result.get('
 - `ORCHESTRATOR_REPORT.md` - **KEY DELIVERABLE:** Orchestration process breakdown
 {self._format_specialized_files(specialized_files)}
 
----
-*Generated using LangGraph Orchestrator-Worker Pattern*
-"""
+{_ORCHESTRATOR_FOOTER}"""
         self.write_text_file("AUDIT_TRAIL.md", audit_content)
         print(
             f"✅ Orchestrator-worker codebase created in: {self.folder_name}/")